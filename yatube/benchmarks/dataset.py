@@ -0,0 +1,274 @@
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from posts.bulk import manual_dates
+from posts.models import Comment, Follow, Group, Post
+from posts.search import install_search, uninstall_search
+
+User = get_user_model()
+
+# размер синтетического набора по умолчанию: минуты на ноутбуке.
+# Большие наборы задаются параметрами команд seed и benchmark
+DEFAULTS = {
+    'users': 1000,
+    'groups': 20,
+    'posts': 20000,
+    'comments': 50000,
+    'follows': 20,
+    'days': 365,
+    'seed': 1,
+}
+# показатель закона Ципфа: у автора с номером k в 2**s раз
+# меньше постов и подписчиков, чем у автора с номером k/2
+ZIPF_EXPONENT = 1.1
+# строки генерируются блоками со своим seed, поэтому набор не зависит
+# от числа процессов и размера пачки
+BLOCK = 1000
+# строк в одной задаче процесса и в одной транзакции
+CHUNK_SIZE = 20000
+# Faker медленный, тексты и имена собираются из заранее
+# сгенерированных фраз и слов
+SENTENCES = 2000
+WORDS = 500
+NAMES = 500
+# доля постов в группах и с хэштегом
+IN_GROUP = 0.7
+TAGGED = 0.2
+# что от чего зависит: следующий этап начинается, когда записан предыдущий
+STAGES = (('users', 'groups'), ('posts', 'follows'), ('comments',))
+PASSWORD = UNUSABLE_PASSWORD_PREFIX + 'seed'
+# сколько секунд процесс ждет чужую запись: SQLite пускает одного писателя
+WORKER_DB_TIMEOUT = 300
+
+_pools = {}
+
+
+def zipf_rank(rng, count, exponent=ZIPF_EXPONENT):
+    """Номер от 0 до count - 1, номер k выпадает с вероятностью
+    примерно 1/(k + 1)**exponent. Обратная функция непрерывного
+    приближения: без таблиц весов на миллионы строк."""
+    power = 1 - exponent
+    rank = (rng.random() * (count ** power - 1) + 1) ** (1 / power)
+    return min(int(rank) - 1, count - 1)
+
+
+def scatter(rank, count):
+    """Перестановка номеров, чтобы популярные посты не были
+    подряд самыми старыми."""
+    return rank * 1000003 % count if count % 1000003 else rank
+
+
+def text_pools(seed):
+    """Фразы, слова и имена Faker: при одном seed одни и те же
+    в любом процессе."""
+    if seed not in _pools:
+        fake = Faker('ru_RU')
+        fake.seed_instance(seed)
+        _pools[seed] = {
+            'sentences': [fake.sentence(nb_words=12)
+                          for _ in range(SENTENCES)],
+            'words': [fake.word() for _ in range(WORDS)],
+            'first_names': [fake.first_name() for _ in range(NAMES)],
+            'last_names': [fake.last_name() for _ in range(NAMES)],
+        }
+    return _pools[seed]
+
+
+def default_workers():
+    """Процессов по умолчанию: ядра, кроме одного, но не больше 8 -
+    дальше упираемся в запись SQLite."""
+    return max(min(multiprocessing.cpu_count(), 8) - 1, 1)
+
+
+def start_worker():
+    # соединение родителя закрыто до fork, свое откроется при записи
+    connection.settings_dict['OPTIONS'] = {
+        **connection.settings_dict['OPTIONS'],
+        'timeout': WORKER_DB_TIMEOUT,
+    }
+
+
+class Generator:
+    """Синтетический набор: авторы постов, группы, цели подписок
+    и комментариев распределены по закону Ципфа, даты постов растут
+    с id. Id пользователей, групп и постов задаются явно, поэтому
+    ссылки считаются без чтения из базы, а пачки пишутся в любом
+    порядке и из любого числа процессов. При одних параметрах набор
+    один и тот же, кроме дат: они отсчитываются от момента генерации."""
+
+    def __init__(self, workers=0, chunk_size=CHUNK_SIZE, **params):
+        self.params = {**DEFAULTS, **params}
+        self.workers = workers
+        self.chunk_size = max(chunk_size // BLOCK, 1) * BLOCK
+        self.now = timezone.now()
+        self.bases = {}
+
+    def generate(self, log=print, derived=True):
+        """Пишет набор по этапам STAGES. derived - пересчитать
+        счетчики, теги и ленты подписок, которые bulk_create не ведет."""
+        self.bases = {
+            kind: model.objects.aggregate(last=Max('pk'))['last'] or 0
+            for kind, model in (('users', User), ('groups', Group),
+                                ('posts', Post))
+        }
+        if self.params['posts']:
+            # индекс поиска дешевле собрать один раз в конце, чем
+            # обновлять триггером на каждый пост
+            uninstall_search(connection)
+        executor = None
+        if self.workers:
+            # дочерние процессы не должны делить соединение с родителем
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=start_worker,
+            )
+        try:
+            for stage in STAGES:
+                self.run_stage(stage, executor, log)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if self.params['posts']:
+                started = time.perf_counter()
+                install_search(connection)
+                log(f'Индекс поиска: {time.perf_counter() - started:.1f} с')
+        if derived:
+            for command in ('recount', 'reindex_tags', 'rebuild_inboxes'):
+                started = time.perf_counter()
+                call_command(command, stdout=StringIO())
+                log(f'{command}: {time.perf_counter() - started:.1f} с')
+
+    def run_stage(self, kinds, executor, log):
+        started = time.perf_counter()
+        tasks = [task for kind in kinds for task in self.tasks(kind)]
+        if executor is None:
+            written = [self.write(*task) for task in tasks]
+        else:
+            written = list(executor.map(self.write, *zip(*tasks)))
+        elapsed = time.perf_counter() - started
+        rows = sum(written)
+        counts = {}
+        for (kind, _, _), count in zip(tasks, written):
+            counts[kind] = counts.get(kind, 0) + count
+        log(', '.join(f'{kind}: {count}' for kind, count in counts.items())
+            + f' - {elapsed:.1f} с, {rows / max(elapsed, 1e-9) * 60:,.0f}'
+            ' строк в минуту')
+
+    def tasks(self, kind):
+        """(kind, start, stop) пачек; подписки делятся по читателям."""
+        count = self.params['users' if kind == 'follows' else kind]
+        step = self.chunk_size
+        if kind == 'follows' and self.params['follows']:
+            step = max(step // self.params['follows'] // BLOCK, 1) * BLOCK
+        for start in range(0, count, step):
+            yield kind, start, min(start + step, count)
+
+    def rows(self, kind, start, stop):
+        """Строки пачки без записи в базу."""
+        make = getattr(self, f'make_{kind}')
+        objects = []
+        for block in range(start, stop, BLOCK):
+            rng = random.Random(f'{self.params["seed"]}:{kind}:{block}')
+            objects.extend(make(rng, block, min(block + BLOCK, stop)))
+        return objects
+
+    def write(self, kind, start, stop):
+        """Строит пачку вне транзакции, а пишет одной транзакцией:
+        остальные процессы ждут SQLite только на время записи."""
+        objects = self.rows(kind, start, stop)
+        if objects:
+            with transaction.atomic(), manual_dates():
+                type(objects[0]).objects.bulk_create(objects)
+        return len(objects)
+
+    def user_id(self, number):
+        return self.bases.get('users', 0) + number + 1
+
+    def group_id(self, number):
+        return self.bases.get('groups', 0) + number + 1
+
+    def post_id(self, number):
+        return self.bases.get('posts', 0) + number + 1
+
+    def post_date(self, number):
+        span = timedelta(days=self.params['days'])
+        return self.now - span + span * number / max(self.params['posts'], 1)
+
+    def text(self, rng, pools, sentences):
+        text = ' '.join(rng.choices(
+            pools['sentences'], k=rng.randint(1, sentences)))
+        if rng.random() < TAGGED:
+            text += ' #' + pools['words'][zipf_rank(rng, WORDS)]
+        return text
+
+    def make_users(self, rng, start, stop):
+        pools = text_pools(self.params['seed'])
+        for number in range(start, stop):
+            pk = self.user_id(number)
+            yield User(pk=pk, username=f'bench{pk}', password=PASSWORD,
+                       first_name=rng.choice(pools['first_names']),
+                       last_name=rng.choice(pools['last_names']))
+
+    def make_groups(self, rng, start, stop):
+        pools = text_pools(self.params['seed'])
+        for number in range(start, stop):
+            pk = self.group_id(number)
+            yield Group(pk=pk, slug=f'bench-{pk}',
+                        title=rng.choice(pools['words']).capitalize(),
+                        description=rng.choice(pools['sentences']))
+
+    def make_posts(self, rng, start, stop):
+        pools = text_pools(self.params['seed'])
+        users, groups = self.params['users'], self.params['groups']
+        for number in range(start, stop):
+            group = None
+            if groups and rng.random() < IN_GROUP:
+                group = self.group_id(zipf_rank(rng, groups))
+            yield Post(pk=self.post_id(number),
+                       author_id=self.user_id(zipf_rank(rng, users)),
+                       group_id=group,
+                       text=self.text(rng, pools, 3),
+                       pub_date=self.post_date(number))
+
+    def make_follows(self, rng, start, stop):
+        """Число подписок у читателя - экспоненциальное со средним
+        follows, авторы выбираются по Ципфу: у первых авторов тысячи
+        подписчиков, у большинства - единицы."""
+        users, average = self.params['users'], self.params['follows']
+        if not average:
+            return
+        for reader in range(start, stop):
+            wanted = min(round(rng.expovariate(1 / average)), users - 1)
+            authors = {zipf_rank(rng, users) for _ in range(wanted)}
+            authors.discard(reader)
+            for author in sorted(authors):
+                yield Follow(user_id=self.user_id(reader),
+                             author_id=self.user_id(author))
+
+    def make_comments(self, rng, start, stop):
+        pools = text_pools(self.params['seed'])
+        users, posts = self.params['users'], self.params['posts']
+        if not posts:
+            return
+        for _ in range(start, stop):
+            number = scatter(zipf_rank(rng, posts), posts)
+            created = self.post_date(number) + timedelta(
+                minutes=rng.randint(1, 60 * 24))
+            yield Comment(post_id=self.post_id(number),
+                          author_id=self.user_id(rng.randrange(users)),
+                          text=self.text(rng, pools, 1),
+                          created=min(created, self.now))
@@ -0,0 +1,175 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from benchmarks import runner
+from benchmarks.dataset import DEFAULTS, Generator, default_workers
+
+
+class Command(BaseCommand):
+    help = ('Замеряет страницы posts/views.py на синтетическом наборе: '
+            'p50/p95/p99 времени, SQL и память на запрос. Набор '
+            'генерируется в отдельной базе BENCHMARK_DATABASE и '
+            'переиспользуется, пока не поменялись его параметры. '
+            'Например, --users 100000 --posts 1000000 --comments 10000000.')
+
+    def add_arguments(self, parser):
+        dataset = parser.add_argument_group('набор данных')
+        for name in ('users', 'groups', 'posts', 'comments', 'follows',
+                     'days', 'seed'):
+            dataset.add_argument(f'--{name}', type=int,
+                                 default=DEFAULTS[name])
+        dataset.add_argument(
+            '--database',
+            default=settings.BENCHMARK_DATABASE,
+            help='Файл SQLite с набором',
+        )
+        dataset.add_argument(
+            '--workers',
+            type=int,
+            default=default_workers(),
+            help='Процессов для генерации набора (см. команду seed)',
+        )
+        dataset.add_argument(
+            '--regenerate',
+            action='store_true',
+            help='Сгенерировать набор заново',
+        )
+        parser.add_argument(
+            '--views',
+            nargs='+',
+            choices=runner.VIEWS,
+            default=runner.VIEWS,
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Замеряемых запросов на страницу',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=20,
+            help='Запросов на страницу до замеров',
+        )
+        parser.add_argument(
+            '--alloc-requests',
+            type=int,
+            default=20,
+            help='Запросов на страницу для замера памяти',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Очищать кэш перед каждым запросом',
+        )
+        parser.add_argument(
+            '--output',
+            help='Куда записать результаты (по умолчанию в '
+                 'BENCHMARK_RESULTS_DIR по дате и коммиту)',
+        )
+        parser.add_argument(
+            '--compare',
+            help='Результаты прошлого запуска для сравнения',
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            help='Ошибка, если p95 какой-то страницы выросло '
+                 'больше, чем на столько процентов',
+        )
+
+    def handle(self, *args, **options):
+        params = {name: options[name] for name in DEFAULTS}
+        old_name = self.open_dataset(
+            options['database'], params, options['regenerate'],
+            options['workers'])
+        try:
+            with override_settings(DEBUG=False, SERVER_TIMING_SAMPLE_RATE=0):
+                views = runner.run(
+                    options['views'], options['requests'],
+                    options['warmup'], options['alloc_requests'],
+                    options['cold'], params['seed'], log=self.stdout.write)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=True)
+
+        results = {
+            'created': timezone.now().isoformat(),
+            **runner.environment(),
+            'dataset': params,
+            'options': {
+                name: options[name] for name in (
+                    'requests', 'warmup', 'alloc_requests', 'cold')
+            },
+            'views': views,
+        }
+        path = options['output'] or self.default_output(results)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {path}'))
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.report(json.load(file), results,
+                            options['max_regression'])
+
+    def open_dataset(self, database, params, regenerate, workers):
+        """Переключает соединение на базу набора, как тестовый раннер,
+        и генерирует набор, если его нет или параметры другие."""
+        meta = f'{database}.json'
+        try:
+            with open(meta) as file:
+                fresh = json.load(file) == params
+        except (OSError, ValueError):
+            fresh = False
+        if regenerate or not fresh:
+            for path in (database, meta):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        connection.settings_dict['TEST']['NAME'] = database
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=True)
+        if regenerate or not fresh:
+            self.stdout.write('Генерируем набор...')
+            Generator(workers=workers, **params).generate(
+                log=self.stdout.write)
+            with open(meta, 'w') as file:
+                json.dump(params, file)
+        return old_name
+
+    def default_output(self, results):
+        stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+        commit = (results['commit'] or 'unknown')[:8]
+        return os.path.join(
+            settings.BENCHMARK_RESULTS_DIR, f'{stamp}-{commit}.json')
+
+    def report(self, old, new, max_regression):
+        self.stdout.write(
+            f'\nСравнение с {(old.get("commit") or "?")[:8]}:')
+        for key, title in (('dataset', 'Наборы данных'),
+                           ('options', 'Параметры замеров')):
+            if old.get(key) != new[key]:
+                self.stdout.write(self.style.WARNING(
+                    f'{title} разные, сравнение условное'))
+        regressions = []
+        for view, metric, before, after, change in runner.compare(old, new):
+            line = f'{view:14} {metric:20} {before:10.2f} -> {after:10.2f}'
+            if change is not None:
+                line += f' ({change:+.1f}%)'
+                if (metric == 'p95_ms' and max_regression is not None
+                        and change > max_regression):
+                    regressions.append(view)
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(
+                f'p95 выросло больше чем на {max_regression}%: '
+                f'{", ".join(regressions)}')
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.dataset import CHUNK_SIZE, DEFAULTS, Generator, default_workers
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, подписками и комментариями: bulk_create пачками '
+            'в транзакциях из нескольких процессов. Авторы и цели '
+            'подписок распределены по закону Ципфа, при одном --seed '
+            'набор один и тот же.')
+
+    def add_arguments(self, parser):
+        for name, help_text in (
+                ('users', 'Пользователей'),
+                ('groups', 'Групп'),
+                ('posts', 'Постов'),
+                ('comments', 'Комментариев'),
+                ('follows', 'Подписок на читателя в среднем'),
+                ('days', 'За сколько дней до сегодня идут посты'),
+                ('seed', 'Seed генератора')):
+            parser.add_argument(f'--{name}', type=int,
+                                default=DEFAULTS[name], help=help_text)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=default_workers(),
+            help='Процессов-генераторов; 0 - все в этом процессе',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Строк в одной транзакции',
+        )
+        parser.add_argument(
+            '--skip-derived',
+            action='store_true',
+            help=('Не пересчитывать счетчики, теги и ленты подписок '
+                  '(recount, reindex_tags, rebuild_inboxes)'),
+        )
+
+    def handle(self, *args, **options):
+        params = {name: options[name] for name in DEFAULTS}
+        if params['users'] < 1 and (params['posts'] or params['comments']
+                                    or params['follows']):
+            raise CommandError('Постам и подпискам нужны пользователи')
+        if params['comments'] and not params['posts']:
+            raise CommandError('Комментариям нужны посты')
+        Generator(
+            workers=options['workers'], chunk_size=options['chunk_size'],
+            **params,
+        ).generate(log=self.stdout.write,
+                   derived=not options['skip_derived'])
+        self.stdout.write(self.style.SUCCESS('Готово'))
@@ -0,0 +1,230 @@
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+import tracemalloc
+from collections import Counter
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Max, Min
+from django.test import Client
+from django.urls import reverse
+
+from core.instrumentation import QueryTimer, RequestMetrics
+from posts.models import Follow, Group, Post
+
+from .dataset import zipf_rank
+
+User = get_user_model()
+
+VIEWS = ('index', 'group_posts', 'profile', 'post_detail', 'follow_index')
+# что сравнивать между запусками; больше - хуже
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_mean',
+            'alloc_peak_kib_p50')
+# сколько самых популярных групп и авторов берем в выборку
+POPULAR = 1000
+
+
+def percentile(values, q):
+    """q-й процентиль (0-100) с линейной интерполяцией."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class Targets:
+    """Что запрашивать. Популярные группы и авторы выбираются чаще,
+    как и читатели с большим числом подписок; посты - равномерно
+    по id. Выбор зависит только от seed и данных в базе."""
+
+    def __init__(self, seed, readers=20):
+        self.random = random.Random(seed)
+        self.anonymous = Client()
+        self.groups = list(
+            Group.objects.order_by('-posts_count', 'pk')
+            .values_list('slug', flat=True)[:POPULAR])
+        self.authors = list(
+            Post.objects.values('author__username')
+            .annotate(posts=Count('pk'))
+            .order_by('-posts', 'author__username')
+            .values_list('author__username', flat=True)[:POPULAR])
+        self.posts = Post.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        self.readers = self.log_in_readers(readers)
+
+    def log_in_readers(self, count):
+        """Клиенты читателей с подписками. Строка Follow, взятая
+        по случайному id, попадает на читателя тем чаще, чем больше
+        у него подписок."""
+        bounds = Follow.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            return []
+        user_ids = {
+            Follow.objects.filter(pk__gte=self.random.randint(
+                bounds['first'], bounds['last'])
+            ).order_by('pk').values_list('user', flat=True)[0]
+            for _ in range(count)
+        }
+        clients = []
+        for user in User.objects.filter(pk__in=user_ids).order_by('pk'):
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        return clients
+
+    def popular(self, items):
+        return items[zipf_rank(self.random, len(items))]
+
+    def available(self, view):
+        return {
+            'group_posts': bool(self.groups),
+            'profile': bool(self.authors),
+            'post_detail': self.posts['first'] is not None,
+            'follow_index': bool(self.readers),
+        }.get(view, True)
+
+    def request(self, view):
+        """(клиент, адрес) очередного запроса к странице."""
+        if view == 'group_posts':
+            url = reverse('posts:group_list', args=[
+                self.popular(self.groups)])
+        elif view == 'profile':
+            url = reverse('posts:profile', args=[
+                self.popular(self.authors)])
+        elif view == 'post_detail':
+            url = reverse('posts:post_detail', args=[self.random.randint(
+                self.posts['first'], self.posts['last'])])
+        elif view == 'follow_index':
+            return (self.random.choice(self.readers),
+                    reverse('posts:follow_index'))
+        else:
+            url = reverse(f'posts:{view}')
+        return self.anonymous, url
+
+
+def measure(targets, view, requests, warmup=0, cold=False):
+    """Время, коды ответов и SQL каждого запроса после прогрева."""
+    samples = []
+    for number in range(warmup + requests):
+        client, url = targets.request(view)
+        if cold:
+            cache.clear()
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(QueryTimer(metrics)):
+            start = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - start
+        if number >= warmup:
+            samples.append((elapsed, response.status_code,
+                            metrics.sql_count, metrics.sql_time))
+    return samples
+
+
+def allocations(targets, view, requests, cold=False):
+    """Пик памяти, выделенной за запрос, в байтах. Отдельный проход:
+    tracemalloc замедляет интерпретатор в разы и испортил бы время."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(requests):
+            client, url = targets.request(view)
+            if cold:
+                cache.clear()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            client.get(url)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def summarize(samples, peaks):
+    timings = [elapsed * 1000 for elapsed, _, _, _ in samples]
+    queries = [count for _, _, count, _ in samples]
+    summary = {
+        'requests': len(samples),
+        'status': dict(Counter(str(status) for _, status, _, _ in samples)),
+        'mean_ms': sum(timings) / len(timings),
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'max_ms': max(timings),
+        'queries_mean': sum(queries) / len(queries),
+        'queries_max': max(queries),
+        'sql_ms_mean': sum(
+            sql_time for _, _, _, sql_time in samples) * 1000 / len(samples),
+    }
+    if peaks:
+        summary['alloc_peak_kib_p50'] = percentile(peaks, 50) / 1024
+        summary['alloc_peak_kib_max'] = max(peaks) / 1024
+    return summary
+
+
+def run(views=VIEWS, requests=200, warmup=20, alloc_requests=20,
+        cold=False, seed=1, log=print):
+    """Прогоняет страницы на текущей базе и возвращает сводку
+    по каждой: процентили времени, SQL и память на запрос."""
+    targets = Targets(seed)
+    results = {}
+    for view in views:
+        if not targets.available(view):
+            log(f'{view}: нет данных, пропускаем')
+            continue
+        samples = measure(targets, view, requests, warmup, cold)
+        peaks = allocations(targets, view, alloc_requests, cold)
+        results[view] = summarize(samples, peaks)
+        log(f'{view}: p50 {results[view]["p50_ms"]:.1f} мс, '
+            f'p95 {results[view]["p95_ms"]:.1f} мс, '
+            f'SQL {results[view]["queries_mean"]:.1f}')
+    return results
+
+
+def git(*args):
+    try:
+        return subprocess.run(
+            ('git',) + args, cwd=settings.BASE_DIR, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Где и на чем мерили: без этого результаты разных коммитов
+    не с чем сопоставить."""
+    status = git('status', '--porcelain')
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+    }
+
+
+def compare(old, new):
+    """Строки (страница, метрика, было, стало, изменение в %)
+    по страницам, которые есть в обоих результатах."""
+    rows = []
+    for view, summary in new['views'].items():
+        before = old['views'].get(view)
+        if before is None:
+            continue
+        for metric in COMPARED:
+            if metric not in summary or metric not in before:
+                continue
+            change = None
+            if before[metric]:
+                change = (summary[metric] / before[metric] - 1) * 100
+            rows.append((view, metric, before[metric], summary[metric],
+                         change))
+    return rows
@@ -0,0 +1,63 @@
+from collections import Counter
+
+from django.test import TestCase
+
+from benchmarks import runner
+from benchmarks.dataset import Generator
+from posts.models import Comment, Follow, Inbox, Post
+
+
+class BenchmarkTests(TestCase):
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(runner.percentile(values, 0), 1)
+        self.assertEqual(runner.percentile(values, 50), 3)
+        self.assertEqual(runner.percentile(values, 95), 4.8)
+        self.assertEqual(runner.percentile(values, 100), 5)
+        self.assertIsNone(runner.percentile([], 50))
+
+    def test_generated_dataset_is_skewed(self):
+        generator = Generator(users=50, groups=3, posts=500, comments=300,
+                              follows=5, seed=7)
+        generator.generate(log=lambda message: None)
+
+        self.assertEqual(Post.objects.count(), 500)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(Inbox.objects.exists())
+        posts = Counter(Post.objects.values_list('author', flat=True))
+        self.assertEqual(posts.most_common(1)[0][0], generator.user_id(0))
+        followers = Counter(Follow.objects.values_list('author', flat=True))
+        self.assertGreater(followers[generator.user_id(0)],
+                           followers[generator.user_id(49)])
+        dates = list(Post.objects.order_by('pk').values_list(
+            'pub_date', flat=True))
+        self.assertEqual(dates, sorted(dates))
+
+    def test_rows_do_not_depend_on_chunks(self):
+        def rows(generator, *ranges):
+            return [
+                (post.pk, post.author_id, post.group_id, post.text)
+                for start, stop in ranges
+                for post in generator.rows('posts', start, stop)
+            ]
+
+        whole = rows(Generator(seed=3), (0, 2000))
+        self.assertEqual(whole, rows(Generator(seed=3), (0, 1000),
+                                     (1000, 2000)))
+        self.assertNotEqual(whole, rows(Generator(seed=4), (0, 2000)))
+
+    def test_run_reports_every_view(self):
+        Generator(users=20, groups=2, posts=60, comments=30,
+                  follows=3).generate(log=lambda message: None)
+
+        results = runner.run(requests=3, warmup=1, alloc_requests=1,
+                             log=lambda message: None)
+
+        self.assertEqual(set(results), set(runner.VIEWS))
+        for summary in results.values():
+            self.assertEqual(summary['status'], {'200': 3})
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+            self.assertGreater(summary['queries_mean'], 0)
+            self.assertIn('alloc_peak_kib_p50', summary)
@@ -0,0 +1,174 @@
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.backends.django import (
+    DjangoTemplates, Template, reraise
+)
+from django.template.exceptions import TemplateDoesNotExist
+
+from .metrics import CACHE_REQUESTS
+from .slow_queries import log_slow_query
+
+# замеры текущего запроса; None, если запрос не попал в выборку
+current_metrics = ContextVar('current_metrics', default=None)
+# внутри get_many(): многие бэкенды сами зовут в нем get() по ключам
+in_get_many = ContextVar('in_get_many', default=False)
+MISSING = object()
+# префикс ключа кэша для метрик: feed-gen:..., post-card:...,
+# template.cache..., sorl-thumbnail||...
+KEY_PREFIX = re.compile(r'[.:|]')
+
+
+def key_prefix(key):
+    return KEY_PREFIX.split(str(key), 1)[0]
+
+
+class RequestMetrics:
+    """Что и сколько стоило одному запросу. Времена в секундах."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 2),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing. Время шаблонов включает
+        запросы и кэш, сделанные при рендере, так что метрики
+        пересекаются и в сумме не дают total."""
+        return ', '.join((
+            f'db;dur={self.sql_time * 1000:.1f};'
+            f'desc="{self.sql_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hit, '
+            f'{self.cache_misses} miss"',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+class QueryTimer:
+    """Обертка для connection.execute_wrapper(): считает запросы
+    и их время в замерах запроса. С request еще и пишет запросы
+    дольше SLOW_QUERY_THRESHOLD в лог медленных (core/slow_queries.py)."""
+
+    def __init__(self, metrics, request=None):
+        self.metrics = metrics
+        self.request = request
+        self.slow = None if request is None else (
+            settings.SLOW_QUERY_THRESHOLD)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics.sql_count += 1
+            self.metrics.sql_time += elapsed
+        if self.slow is not None and elapsed >= self.slow:
+            match = self.request.resolver_match
+            log_slow_query(
+                context['connection'], match.view_name if match else None,
+                sql, params, many, elapsed)
+        return result
+
+
+def instrument_cache(cache):
+    """Учет попаданий и промахов get()/get_many() для экземпляра кэша:
+    по префиксам ключей в метриках и в замерах запроса, если он
+    в выборке. Экземпляры кэша у каждого потока свои, поэтому обертка
+    ставится один раз на экземпляр."""
+    if getattr(cache, 'instrumented', False):
+        return
+    get, get_many = cache.get, cache.get_many
+
+    def counted_get(key, default=None, version=None):
+        if in_get_many.get():
+            return get(key, default, version=version)
+        value = get(key, MISSING, version=version)
+        hit = value is not MISSING
+        CACHE_REQUESTS.labels(
+            key_prefix(key), 'hit' if hit else 'miss').inc()
+        metrics = current_metrics.get()
+        if metrics is not None:
+            if hit:
+                metrics.cache_hits += 1
+            else:
+                metrics.cache_misses += 1
+        return value if hit else default
+
+    def counted_get_many(keys, version=None):
+        keys = list(keys)
+        # ключи считаем один раз, здесь, а не во вложенных get()
+        token = in_get_many.set(True)
+        try:
+            found = get_many(keys, version=version)
+        finally:
+            in_get_many.reset(token)
+        # одна запись в метрики на префикс, а не на ключ
+        results = Counter(
+            (key_prefix(key), 'hit' if key in found else 'miss')
+            for key in keys
+        )
+        for labels, count in results.items():
+            CACHE_REQUESTS.labels(*labels).inc(count)
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.cache_hits += len(found)
+            metrics.cache_misses += len(keys) - len(found)
+        return found
+
+    cache.get, cache.get_many = counted_get, counted_get_many
+    cache.instrumented = True
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        # вложенные шаблоны (render_to_string в тегах) уже внутри
+        # внешнего замера
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+            metrics.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который меряет время рендера шаблонов
+    для запросов в выборке ServerTimingMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
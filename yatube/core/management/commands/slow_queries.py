@@ -0,0 +1,85 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORTS = ('total', 'count', 'max')
+
+
+class Command(BaseCommand):
+    help = ('Сводка лога медленных запросов: отпечатки SQL с наибольшим '
+            'суммарным временем, страницы, откуда они пришли, и их планы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log',
+            default=settings.SLOW_QUERY_LOG,
+            help='Файл лога (по умолчанию SLOW_QUERY_LOG)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Сколько отпечатков показать',
+        )
+        parser.add_argument(
+            '--sort',
+            choices=SORTS,
+            default='total',
+            help='Порядок: суммарное время, число или самый долгий',
+        )
+
+    def read(self, path):
+        """Сводка по отпечаткам; лог читается построчно, в памяти
+        только по записи на отпечаток."""
+        summary = {}
+        try:
+            log = open(path, encoding='utf-8')
+        except FileNotFoundError:
+            raise CommandError(f'Нет лога {path}')
+        with log:
+            for line in log:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                item = summary.setdefault(entry['fingerprint'], {
+                    'sql': entry['sql'], 'count': 0, 'total': 0.0,
+                    'max': 0.0, 'views': {}, 'plan': None,
+                })
+                duration = entry['duration_ms']
+                item['count'] += 1
+                item['total'] += duration
+                item['max'] = max(item['max'], duration)
+                view = entry['view'] or '-'
+                item['views'][view] = item['views'].get(view, 0) + 1
+                if item['plan'] is None and 'plan' in entry:
+                    item['plan'] = entry['plan']
+        return summary
+
+    def handle(self, *args, **options):
+        summary = self.read(options['log'])
+        if not summary:
+            self.stdout.write('Медленных запросов нет')
+            return
+        sort = options['sort']
+        top = sorted(
+            summary.items(), key=lambda item: item[1][sort], reverse=True
+        )[:options['top']]
+
+        self.stdout.write('| Отпечаток | Число | Всего, мс | Макс, мс '
+                          '| Среднее, мс | Страницы |')
+        self.stdout.write('|---|---:|---:|---:|---:|---|')
+        for key, item in top:
+            views = ', '.join(
+                f'{view} ({count})' for view, count in sorted(
+                    item['views'].items(), key=lambda pair: -pair[1]))
+            self.stdout.write(
+                f'| {key} | {item["count"]} | {item["total"]:.1f} '
+                f'| {item["max"]:.1f} '
+                f'| {item["total"] / item["count"]:.1f} | {views} |')
+        for key, item in top:
+            self.stdout.write(f'\n### {key}\n\n```sql\n{item["sql"]}\n```')
+            if item['plan']:
+                self.stdout.write('\n```\n' + '\n'.join(item['plan'])
+                                  + '\n```')
@@ -0,0 +1,397 @@
+import bisect
+import fcntl
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+HEADER = struct.Struct('Q')
+KEY_LENGTH = struct.Struct('I')
+VALUE = struct.Struct('d')
+FILE_SIZE = 1024 * 1024
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# сумма значений завершившихся процессов и блокировка, под которой
+# в нее переносятся их файлы
+DEAD_FILE = 'dead.metrics'
+LOCK_FILE = 'metrics.lock'
+
+_store = None
+_store_lock = threading.Lock()
+REGISTRY = []
+
+
+def value_offset(position, length):
+    """Где лежит значение записи, начатой в position: после длины
+    и ключа, с выравниванием до 8 байт."""
+    return position + (KEY_LENGTH.size + length + 7) // 8 * 8
+
+
+class ValueFile:
+    """Mmap-файл метрик процесса в METRICS_DIR.
+
+    Запись: длина ключа, ключ, выравнивание до 8 байт, double. В начале
+    файла - сколько байт занято; оно пишется последним, так что
+    читатель из другого процесса видит только целые записи. Размер
+    файла не меняется: значения пишутся через memoryview, который
+    держат серии метрик."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(
+            directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.metrics')
+        with open(self.path, 'w+b') as file:
+            file.truncate(FILE_SIZE)
+            self.map = mmap.mmap(file.fileno(), FILE_SIZE)
+        self.values = memoryview(self.map).cast('d')
+        self.used = HEADER.size
+        HEADER.pack_into(self.map, 0, self.used)
+
+    def append(self, key):
+        """Заводит запись и возвращает индекс ее значения в values
+        или None, если файл заполнен."""
+        encoded = key.encode()
+        value_at = value_offset(self.used, len(encoded))
+        end = value_at + VALUE.size
+        if end > FILE_SIZE:
+            return None
+        start = self.used + KEY_LENGTH.size
+        KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[start:start + len(encoded)] = encoded
+        VALUE.pack_into(self.map, value_at, 0.0)
+        self.used = end
+        HEADER.pack_into(self.map, 0, end)
+        return value_at // VALUE.size
+
+
+class ProcessStore:
+    """Значения метрик процесса: файлы ValueFile, новый заводится,
+    когда заполнен предыдущий. Пишет в них только свой процесс,
+    /metrics любого процесса читает все файлы каталога и складывает."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # одна блокировка на процесс: сложение в memoryview не атомарно
+        self.lock = threading.Lock()
+        self.file = ValueFile(directory)
+        self.slots = {}
+
+    def slot(self, key):
+        """(values, индекс) значения ключа; запись заводится один раз."""
+        with self.lock:
+            if key not in self.slots:
+                index = self.file.append(key)
+                if index is None:
+                    self.file = ValueFile(self.directory)
+                    index = self.file.append(key)
+                self.slots[key] = (self.file.values, index)
+            return self.slots[key]
+
+
+def read_file(path):
+    """{ключ: значение} из файла метрик процесса."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        return {}
+    used = min(HEADER.unpack_from(data)[0], len(data))
+    values = {}
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(data, position)[0]
+        start = position + KEY_LENGTH.size
+        value_at = value_offset(position, length)
+        key = data[start:start + length].decode()
+        values[key] = VALUE.unpack_from(data, value_at)[0]
+        position = value_at + VALUE.size
+    return values
+
+
+@contextmanager
+def directory_lock(directory, operation):
+    """flock на файл блокировки каталога; снимается при закрытии."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'a') as file:
+        fcntl.flock(file, operation)
+        yield
+
+
+def write_file(path, values):
+    """Пишет {ключ: значение} в формате ValueFile через временный файл:
+    читатель видит или старое содержимое, или новое целиком."""
+    records = []
+    used = HEADER.size
+    for key, value in values.items():
+        encoded = key.encode()
+        value_at = value_offset(used, len(encoded))
+        record = bytearray(value_at + VALUE.size - used)
+        KEY_LENGTH.pack_into(record, 0, len(encoded))
+        record[KEY_LENGTH.size:KEY_LENGTH.size + len(encoded)] = encoded
+        VALUE.pack_into(record, value_at - used, value)
+        records.append(record)
+        used = value_at + VALUE.size
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(used))
+        file.writelines(records)
+    os.replace(temporary, path)
+
+
+def read_values(directory):
+    """Сумма значений по всем процессам, включая завершившиеся."""
+    total = {}
+    # пока файлы умерших процессов переносятся в DEAD_FILE,
+    # их значения лежат в двух местах сразу
+    with directory_lock(directory, fcntl.LOCK_SH):
+        for path in glob.glob(os.path.join(directory, '*.metrics')):
+            try:
+                values = read_file(path)
+            except FileNotFoundError:
+                continue
+            for key, value in values.items():
+                total[key] = total.get(key, 0.0) + value
+    return total
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fold_dead_files(directory):
+    """Прибавляет значения завершившихся процессов к DEAD_FILE и удаляет
+    их файлы. Сумма по каталогу не меняется: счетчики в /metrics
+    не убывают, и Prometheus не видит ложного сброса."""
+    with directory_lock(directory, fcntl.LOCK_EX):
+        dead = []
+        for path in glob.glob(os.path.join(directory, '*.metrics')):
+            pid = os.path.basename(path).split('-', 1)[0]
+            if pid.isdigit() and not process_alive(int(pid)):
+                dead.append(path)
+        if not dead:
+            return
+        dead_path = os.path.join(directory, DEAD_FILE)
+        try:
+            total = read_file(dead_path)
+        except FileNotFoundError:
+            total = {}
+        for path in dead:
+            for key, value in read_file(path).items():
+                total[key] = total.get(key, 0.0) + value
+        write_file(dead_path, total)
+        for path in dead:
+            os.unlink(path)
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProcessStore(settings.METRICS_DIR)
+            fold_dead_files(settings.METRICS_DIR)
+    return _store
+
+
+def reset_after_fork():
+    # процесс после fork пишет в свой файл, а не в файл родителя
+    global _store
+    _store = None
+    for metric in REGISTRY:
+        metric.children.clear()
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def series_key(name, labels):
+    return json.dumps([name, labels], ensure_ascii=False)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """Серия с этими значениями меток. Место в файле ищется
+        один раз, дальше запись - это только сложение под блокировкой."""
+        try:
+            return self.children[values]
+        except KeyError:
+            labels = [
+                [name, str(value)]
+                for name, value in zip(self.labelnames, values)
+            ]
+            child = self.children[values] = self.make_child(
+                get_store(), labels)
+            return child
+
+    def expose(self, values):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        lines.extend(self.samples(values))
+        return lines
+
+
+class CounterChild:
+    __slots__ = ('lock', 'values', 'index')
+
+    def __init__(self, store, key):
+        self.lock = store.lock
+        self.values, self.index = store.slot(key)
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.values[self.index] += amount
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def make_child(self, store, labels):
+        return CounterChild(store, series_key(self.name, labels))
+
+    def samples(self, values):
+        for key, value in sorted(values.get(self.name, {}).items()):
+            yield f'{self.name}{format_labels(json.loads(key))} {value!r}'
+
+
+class HistogramChild:
+    __slots__ = ('lock', 'buckets', 'bucket_slots', 'sum_slot')
+
+    def __init__(self, store, buckets, bucket_keys, sum_key):
+        self.lock = store.lock
+        self.buckets = buckets
+        self.bucket_slots = [store.slot(key) for key in bucket_keys]
+        self.sum_slot = store.slot(sum_key)
+
+    def observe(self, value):
+        bucket, index = self.bucket_slots[
+            bisect.bisect_left(self.buckets, value)]
+        values, sum_index = self.sum_slot
+        with self.lock:
+            bucket[index] += 1
+            values[sum_index] += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(Metric):
+    """Гистограмма. Корзины хранятся без накопления (одно сложение
+    на наблюдение), накопленные значения и _count считаются при выдаче."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def make_child(self, store, labels):
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        bucket_keys = [
+            series_key(f'{self.name}_bucket', labels + [['le', bound]])
+            for bound in bounds
+        ]
+        return HistogramChild(
+            store, self.buckets, bucket_keys,
+            series_key(f'{self.name}_sum', labels))
+
+    def samples(self, values):
+        buckets = {}
+        for key, value in values.get(f'{self.name}_bucket', {}).items():
+            labels = json.loads(key)
+            bound = labels.pop()[1]
+            buckets.setdefault(json.dumps(labels), {})[bound] = value
+        sums = values.get(f'{self.name}_sum', {})
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for key in sorted(buckets):
+            labels = json.loads(key)
+            total = 0.0
+            for bound in bounds:
+                total += buckets[key].get(bound, 0.0)
+                yield (f'{self.name}_bucket'
+                       f'{format_labels(labels + [["le", bound]])} '
+                       f'{total!r}')
+            yield f'{self.name}_count{format_labels(labels)} {total!r}'
+            yield (f'{self.name}_sum{format_labels(labels)} '
+                   f'{sums.get(key, 0.0)!r}')
+
+
+def exposition():
+    """Все метрики всех процессов в текстовом формате Prometheus."""
+    families = {}
+    for key, value in read_values(settings.METRICS_DIR).items():
+        name, labels = json.loads(key)
+        families.setdefault(name, {})[json.dumps(labels)] = value
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose(families))
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_SECONDS = Histogram(
+    'yatube_request_duration_seconds',
+    'Время ответа по имени URL.',
+    ('view', 'method'),
+    buckets=settings.METRICS_LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    'yatube_requests_total',
+    'Ответы по имени URL и коду статуса.',
+    ('view', 'status'),
+)
+DB_QUERIES = Counter(
+    'yatube_db_queries_total',
+    'SQL-запросы, сделанные при ответе, по имени URL.',
+    ('view',),
+)
+DB_SECONDS = Counter(
+    'yatube_db_query_seconds_total',
+    'Время SQL-запросов при ответе по имени URL.',
+    ('view',),
+)
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests_total',
+    'Чтения ключей кэша по префиксу ключа: hit или miss.',
+    ('prefix', 'result'),
+)
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_seconds',
+    'Время обработки загруженной картинки по шагам.',
+    ('step',),
+    buckets=settings.METRICS_THUMBNAIL_BUCKETS,
+)
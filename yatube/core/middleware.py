@@ -0,0 +1,85 @@
+import json
+import logging
+import random
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from . import metrics as registry
+from .instrumentation import (
+    QueryTimer, RequestMetrics, current_metrics, instrument_cache
+)
+
+logger = logging.getLogger('core.timing')
+# остальные методы в метриках - other, чтобы не плодить серии
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class ServerTimingMiddleware:
+    """Замеряет долю запросов (SERVER_TIMING_SAMPLE_RATE): число и время
+    SQL, время шаблонов, попадания в кэш и общее время. Результат
+    уходит в заголовок Server-Timing и строкой JSON в лог core.timing.
+    Запрос вне выборки стоит одного random()."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            for alias in settings.CACHES:
+                instrument_cache(caches[alias])
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(
+                            QueryTimer(metrics)))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+            metrics.finish()
+
+        response['Server-Timing'] = metrics.server_timing()
+        match = request.resolver_match
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            **metrics.as_dict(),
+        }, ensure_ascii=False))
+        return response
+
+
+class MetricsMiddleware:
+    """Метрики каждого ответа для /metrics (core/metrics.py): время
+    по имени URL, коды статусов, число и время SQL. Запись метрики -
+    сложение в mmap-файле процесса, без обращений к сети и диску."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for alias in settings.CACHES:
+            instrument_cache(caches[alias])
+        metrics = RequestMetrics()
+        with connections['default'].execute_wrapper(
+                QueryTimer(metrics, request)):
+            response = self.get_response(request)
+        metrics.finish()
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        method = request.method if request.method in METHODS else 'other'
+        registry.REQUEST_SECONDS.labels(view, method).observe(metrics.total)
+        registry.REQUESTS.labels(view, response.status_code).inc()
+        if metrics.sql_count:
+            registry.DB_QUERIES.labels(view).inc(metrics.sql_count)
+            registry.DB_SECONDS.labels(view).inc(metrics.sql_time)
+        return response
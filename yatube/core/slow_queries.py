@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError
+
+logger = logging.getLogger('core.slow_queries')
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+# IN (%s, %s, ...) с любым числом значений - один отпечаток
+VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+SPACES = re.compile(r'\s+')
+
+# отпечатки, для которых план уже записан в лог этим процессом
+_explained = OrderedDict()
+_explained_lock = threading.Lock()
+
+
+def normalize(sql):
+    """SQL без значений: строки и числа становятся ?, списки IN -
+    (...), пробелы схлопываются. Запросы, которые отличаются только
+    значениями, получают один отпечаток."""
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql.replace('%s', '?'))
+    sql = VALUE_LIST.sub('(...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def first_time(key):
+    """True только при первом вызове с этим отпечатком (в пределах
+    SLOW_QUERY_EXPLAIN_CACHE последних)."""
+    with _explained_lock:
+        if key in _explained:
+            _explained.move_to_end(key)
+            return False
+        _explained[key] = True
+        if len(_explained) > settings.SLOW_QUERY_EXPLAIN_CACHE:
+            _explained.popitem(last=False)
+        return True
+
+
+def explain(connection, sql, params):
+    """План запроса. Курсор бэкенда, а не CursorWrapper: EXPLAIN
+    не проходит через execute_wrapper и не попадает в метрики."""
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else (
+        'EXPLAIN ')
+    try:
+        with connection.cursor() as cursor:
+            cursor.cursor.execute(prefix + sql, params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+    # курсор бэкенда бросает исключения драйвера, а не DatabaseError:
+    # неудачный EXPLAIN не должен ронять запрос, который прошел
+    except (DatabaseError, connection.Database.Error) as error:
+        return [f'EXPLAIN не удался: {error}']
+
+
+def log_slow_query(connection, view, sql, params, many, duration):
+    """Пишет медленный запрос строкой JSON в лог core.slow_queries.
+    План добавляется к первой записи с этим отпечатком."""
+    normalized = normalize(sql)
+    key = fingerprint(normalized)
+    entry = {
+        'fingerprint': key,
+        'view': view,
+        'duration_ms': round(duration * 1000, 2),
+        'sql': normalized,
+    }
+    is_select = sql.lstrip()[:6].upper() == 'SELECT'
+    if is_select and not many and first_time(key):
+        entry['plan'] = explain(connection, sql, params)
+    logger.warning(json.dumps(entry, ensure_ascii=False))
@@ -0,0 +1,96 @@
+import os
+import re
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.metrics import (
+    DEAD_FILE, CounterChild, HistogramChild, ProcessStore, exposition,
+    fold_dead_files, series_key
+)
+
+
+class MetricsTests(TestCase):
+
+    def sample(self, text, line):
+        match = re.search(rf'^{re.escape(line)} (\S+)$', text, re.M)
+        return float(match.group(1)) if match else 0.0
+
+    def test_requests_counted_per_url_name(self):
+        url = reverse('metrics')
+        line = 'yatube_requests_total{view="posts:index",status="200"}'
+        before = self.sample(self.client.get(url).content.decode(), line)
+
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+
+        response = self.client.get(url)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertEqual(self.sample(text, line), before + 2)
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', text)
+        self.assertIn('yatube_cache_requests_total{prefix="feed-gen"', text)
+
+    def test_values_summed_across_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        labels = [['view', 'test'], ['status', '200']]
+        buckets = (0.1, 1)
+        bucket_keys = [
+            series_key('yatube_request_duration_seconds_bucket',
+                       [['view', 'test'], ['method', 'GET'], ['le', bound]])
+            for bound in ('0.1', '1.0', '+Inf')
+        ]
+        sum_key = series_key(
+            'yatube_request_duration_seconds_sum',
+            [['view', 'test'], ['method', 'GET']])
+
+        # два «процесса» с отдельными файлами в одном каталоге
+        for observed in (0.05, 0.5):
+            store = ProcessStore(directory)
+            CounterChild(
+                store, series_key('yatube_requests_total', labels)).inc(3)
+            HistogramChild(
+                store, buckets, bucket_keys, sum_key).observe(observed)
+
+        with override_settings(METRICS_DIR=directory):
+            text = exposition()
+        self.assertEqual(self.sample(
+            text, 'yatube_requests_total{view="test",status="200"}'), 6)
+        histogram = 'yatube_request_duration_seconds'
+        series = '{view="test",method="GET"'
+        self.assertEqual(self.sample(
+            text, f'{histogram}_bucket{series},le="0.1"}}'), 1)
+        self.assertEqual(self.sample(
+            text, f'{histogram}_bucket{series},le="+Inf"}}'), 2)
+        self.assertEqual(self.sample(text, f'{histogram}_count{series}}}'), 2)
+        self.assertAlmostEqual(
+            self.sample(text, f'{histogram}_sum{series}}}'), 0.55)
+
+    def test_dead_process_values_kept(self):
+        """Файлы завершившихся процессов складываются в DEAD_FILE,
+        счетчик в /metrics от этого не уменьшается."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        key = series_key('yatube_requests_total',
+                         [['view', 'test'], ['status', '200']])
+        line = 'yatube_requests_total{view="test",status="200"}'
+        live = ProcessStore(directory)
+        CounterChild(live, key).inc(1)
+        # pid больше pid_max: такого процесса точно нет
+        for number, amount in enumerate((2, 4)):
+            store = ProcessStore(directory)
+            CounterChild(store, key).inc(amount)
+            os.rename(store.file.path, os.path.join(
+                directory, f'999999999-{number}.metrics'))
+            fold_dead_files(directory)
+
+            with override_settings(METRICS_DIR=directory):
+                self.assertEqual(
+                    self.sample(exposition(), line), 3 + number * 4)
+        self.assertEqual(
+            sorted(name for name in os.listdir(directory)
+                   if name.endswith('.metrics')),
+            sorted([DEAD_FILE, os.path.basename(live.file.path)]))
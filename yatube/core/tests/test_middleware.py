@@ -0,0 +1,45 @@
+import json
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+class ServerTimingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_sampled_request_reports_timings(self):
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('posts:index'))
+
+        header = response['Server-Timing']
+        self.assertRegex(
+            header, rf'db;dur=[\d.]+;desc="{len(queries)} queries"')
+        self.assertRegex(header, r'tpl;dur=[\d.]+')
+        self.assertRegex(header, r'total;dur=[\d.]+')
+        hits, misses = map(int, re.search(
+            r'cache;desc="(\d+) hit, (\d+) miss"', header).groups())
+        self.assertGreater(misses, 0)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['sql_count'], len(queries))
+        self.assertEqual(record['cache_hits'], hits)
+
+        # вторая страница целиком из кэша
+        with self.assertLogs('core.timing', 'INFO'):
+            response = self.client.get(reverse('posts:index'))
+        self.assertIn('0 miss', response['Server-Timing'])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_request_untouched(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
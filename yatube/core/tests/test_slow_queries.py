@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import slow_queries
+from core.slow_queries import normalize
+
+
+class SlowQueryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        slow_queries._explained.clear()
+
+    def test_normalize_hides_values(self):
+        self.assertEqual(
+            normalize("SELECT *  FROM t\n WHERE a = 'x''y' AND b IN "
+                      "(%s, %s, %s) LIMIT 10"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?')
+        self.assertEqual(
+            normalize('SELECT * FROM t WHERE b IN (1, 2)'),
+            normalize('SELECT * FROM t WHERE b IN (%s)'))
+
+    def test_failed_explain_is_logged(self):
+        plan = slow_queries.explain(
+            connection, 'SELECT * FROM missing_table', ())
+        self.assertEqual(len(plan), 1)
+        self.assertTrue(plan[0].startswith('EXPLAIN не удался'))
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    def test_plan_is_logged_once_per_fingerprint(self):
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+            cache.clear()
+            self.client.get(reverse('posts:index'))
+
+        entries = [json.loads(line.split(':', 2)[2]) for line in logs.output]
+        self.assertEqual({entry['view'] for entry in entries},
+                         {'posts:index'})
+        planned = [entry['fingerprint'] for entry in entries
+                   if 'plan' in entry]
+        self.assertTrue(planned)
+        self.assertEqual(len(planned), len(set(planned)))
+        self.assertLess(len(planned), len(entries))
+
+    def test_summary_command(self):
+        entries = [
+            {'fingerprint': 'a', 'view': 'posts:index', 'duration_ms': 5,
+             'sql': 'SELECT ?', 'plan': ['SCAN posts_post']},
+            {'fingerprint': 'a', 'view': 'posts:index', 'duration_ms': 7,
+             'sql': 'SELECT ?'},
+            {'fingerprint': 'b', 'view': None, 'duration_ms': 9,
+             'sql': 'SELECT ? FROM t'},
+        ]
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.log', delete=False) as log:
+            for entry in entries:
+                log.write(json.dumps(entry) + '\n')
+        self.addCleanup(os.unlink, log.name)
+
+        out = StringIO()
+        call_command('slow_queries', log=log.name, top=1, stdout=out)
+        output = out.getvalue()
+        self.assertIn('| a | 2 | 12.0 | 7.0 | 6.0 | posts:index (2) |', output)
+        self.assertIn('SCAN posts_post', output)
+        self.assertNotIn('| b |', output)
@@ -1,5 +1,8 @@
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from .metrics import CONTENT_TYPE, exposition
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +18,8 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """Метрики всех процессов сервера в формате Prometheus."""
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
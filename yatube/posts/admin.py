@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
 from .models import Post, Group, Follow, Comment
+from .search import match_expression, matching_ids_sql
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,6 +12,16 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по индексу FTS5 (posts/search.py), а не LIKE по тексту."""
+        if not search_term:
+            return queryset, False
+        expression = match_expression(search_term)
+        if not expression:
+            return queryset.none(), False
+        return queryset.filter(
+            pk__in=RawSQL(*matching_ids_sql(expression))), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('slug', 'title', 'description')
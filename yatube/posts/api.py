@@ -0,0 +1,222 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+
+from . import caching
+from .counters import get_user_stats
+from .models import Comment, Group, Post, User
+from .utils import JSON_ENCODER, KeysetPaginator, encode_cursor
+
+# JSON-версии лент и страницы поста для мобильного клиента. Строки
+# читаются через values_list() без экземпляров моделей и шаблонов,
+# страницы листаются курсорами тех же лент, ETag считается
+# по поколениям лент из posts/caching.py до чтения постов.
+
+# поле ответа -> поле values_list; ?fields= выбирает из них
+POST_FIELDS = {
+    'id': 'pk',
+    'pub_date': 'pub_date',
+    'text': 'text',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = ('id', 'author', 'text', 'created')
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSON_ENCODER.encode(data), status=status,
+                        content_type='application/json')
+
+
+def api_view(view):
+    """Только чтение; ApiError превращается в ответ JSON с ошибкой."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return json_response({'error': error.message}, error.status)
+    return wrapper
+
+
+def conditional(request, scopes, build, state=()):
+    """Ответ с ETag по поколениям лент scopes, адресу запроса и state -
+    уже прочитанным данным ответа, которые поколения не отражают.
+    Если клиент уже видел эту версию - 304 без чтения постов."""
+    generations = caching.get_generations(scopes)
+    digest = hashlib.sha1(
+        f'{request.get_full_path()}:{generations}:{tuple(state)}'.encode()
+    ).hexdigest()
+    etag = quote_etag(digest)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build()
+        response['ETag'] = etag
+    # кэшировать можно, но каждый раз сверяясь с сервером
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def selected_fields(request):
+    value = request.GET.get('fields')
+    if not value:
+        return list(POST_FIELDS)
+    fields = list(dict.fromkeys(value.split(',')))
+    unknown = [field for field in fields if field not in POST_FIELDS]
+    if unknown:
+        raise ApiError(400, f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def page_size(request, default):
+    value = request.GET.get('limit')
+    if value is None:
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if not 1 <= size <= settings.API_MAX_PAGE_SIZE:
+        raise ApiError(
+            400, f'limit - число от 1 до {settings.API_MAX_PAGE_SIZE}')
+    return size
+
+
+class RowPaginator(KeysetPaginator):
+    """Пагинатор по строкам values_list, которые начинаются
+    с (id, дата)."""
+
+    def cursor_for(self, direction, row):
+        return encode_cursor(direction, row[1], row[0])
+
+
+def post_rows(queryset, fields):
+    """values_list постов для RowPaginator: ключ и выбранные поля."""
+    return queryset.values_list(
+        'pk', 'pub_date', *[POST_FIELDS[field] for field in fields])
+
+
+def serialize_posts(rows, fields):
+    storage = Post._meta.get_field('image').storage
+    image = fields.index('image') if 'image' in fields else None
+    results = []
+    for row in rows:
+        values = list(row[2:])
+        if image is not None:
+            name = values[image]
+            values[image] = storage.url(name) if name else None
+        results.append(dict(zip(fields, values)))
+    return results
+
+
+def serialize_page(page, serialize):
+    return {
+        'results': serialize(page.object_list),
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+
+
+def feed_response(request, queryset, scopes, extra=(), state=()):
+    fields = selected_fields(request)
+    per_page = page_size(request, settings.NUMBER_OF_POSTS)
+
+    def build():
+        paginator = RowPaginator(post_rows(queryset, fields), per_page)
+        page = paginator.get_cursor_page(request.GET.get('cursor'))
+        return json_response({
+            **dict(extra),
+            **serialize_page(
+                page, lambda rows: serialize_posts(rows, fields)),
+        })
+
+    return conditional(request, scopes, build, state)
+
+
+@api_view
+def index(request):
+    """ Лента главной страницы."""
+    return feed_response(request, Post.objects.all(), [('index',)])
+
+
+@api_view
+def group_posts(request, slug):
+    """ Группа и ее лента."""
+    group = Group.objects.filter(slug=slug).values(
+        'pk', 'slug', 'title', 'description', 'posts_count').first()
+    if group is None:
+        raise ApiError(404, 'Группа не найдена')
+    group_id = group.pop('pk')
+    return feed_response(
+        request, Post.objects.filter(group_id=group_id),
+        [('group', group_id)], [('group', group)], group.values())
+
+
+@api_view
+def profile(request, username):
+    """ Автор, его счетчики и лента."""
+    author = User.objects.filter(username=username).first()
+    if author is None:
+        raise ApiError(404, 'Автор не найден')
+    stats = get_user_stats(author)
+    header = {
+        'username': author.username,
+        'first_name': author.first_name,
+        'last_name': author.last_name,
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
+    }
+    # подписки не сдвигают поколение ленты автора, а счетчики меняют
+    return feed_response(
+        request, Post.objects.filter(author_id=author.pk),
+        [('author', author.pk)], [('author', header)],
+        header.values())
+
+
+def serialize_comments(rows):
+    return [dict(zip(COMMENT_FIELDS, (pk, author, text, created)))
+            for pk, created, author, text in rows]
+
+
+@api_view
+def post_detail(request, post_id):
+    """ Пост и страница его комментариев, от старых к новым."""
+    fields = selected_fields(request)
+    per_page = page_size(request, settings.NUMBER_OF_COMMENTS)
+    # автор - для ETag, дальше строка как у post_rows()
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'pk', 'pub_date',
+        *[POST_FIELDS[field] for field in fields]).first()
+    if row is None:
+        raise ApiError(404, 'Пост не найден')
+
+    def build():
+        paginator = RowPaginator(
+            Comment.objects.filter(post_id=post_id).values_list(
+                'pk', 'created', 'author__username', 'text'),
+            per_page, date_field='created', ascending=True)
+        page = paginator.get_cursor_page(request.GET.get('cursor'))
+        return json_response({
+            'post': serialize_posts([row[1:]], fields)[0],
+            'comments': serialize_page(page, serialize_comments),
+        })
+
+    # правка поста и его комментариев сдвигает поколение ленты автора
+    return conditional(request, [('author', row[0])], build)
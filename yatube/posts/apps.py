@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def restore_search(using, **kwargs):
+    # миграции, пересоздающие posts_post в SQLite, теряют триггеры индекса
+    from .search import install_search
+    install_search(connections[using], create=False)
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(restore_search, sender=self)
@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+
+from . import caching, counters
+from .feeds import heavy_author_ids, timeline_key
+from .models import Comment, Follow, Inbox, MediaBlob, Post, PostTag
+from .tags import extract_tags
+
+# Массовая запись постов и комментариев в обход save(): bulk_create
+# не шлет сигналов, поэтому их работа (теги, ленты подписок, счетчики,
+# кэш, файлы картинок) делается здесь, пачкой за раз.
+
+
+@contextmanager
+def manual_dates():
+    """bulk_create с датами из записей, а не с текущим временем
+    auto_now_add."""
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def next_pk(model):
+    """Первый свободный id. Надежен, только пока транзакция держит
+    блокировку записи: в SQLite - после первой записи в транзакции."""
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def windows(queryset, first, last, size):
+    """Строки queryset с id от first до last окнами по size, по id."""
+    position = first - 1
+    while position < last:
+        window = list(queryset.filter(pk__gt=position, pk__lte=last)
+                      .order_by('pk')[:size])
+        if not window:
+            return
+        yield window
+        position = window[-1][0]
+
+
+def posts_created(posts):
+    """Работа сигнала post_saved для новых постов.
+    posts - кортежи (id, автор, группа, текст, дата, картинка)."""
+    PostTag.objects.bulk_create(
+        [PostTag(tag=tag, post_id=pk, pub_date=pub_date)
+         for pk, _, _, text, pub_date, _ in posts
+         for tag in extract_tags(text)],
+        ignore_conflicts=True,
+    )
+    fan_out(posts)
+
+    authors = {author for _, author, _, _, _, _ in posts}
+    groups = {group for _, _, group, _, _, _ in posts} - {None}
+    images = {image for _, _, _, _, _, image in posts} - {''}
+    counters.recount_users(authors)
+    counters.recount_groups(groups)
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name) for name in images], ignore_conflicts=True)
+    counters.recount_blobs(images)
+
+    caching.bump('index')
+    for author in authors:
+        caching.bump('author', author)
+        # кэш последних постов автора соберется заново
+        cache.delete(timeline_key(author))
+    for group in groups:
+        caching.bump('group', group)
+    for tag in {tag for _, _, _, text, _, _ in posts
+                for tag in extract_tags(text)}:
+        caching.bump('tag', tag)
+
+
+def fan_out(posts):
+    """Раскладывает посты по лентам подписчиков, как fan_out_post,
+    но одним запросом подписчиков на автора."""
+    by_author = {}
+    for pk, author, _, _, pub_date, _ in posts:
+        by_author.setdefault(author, []).append((pk, pub_date))
+    heavy = heavy_author_ids(by_author)
+    followers = {}
+    for user, author in (Follow.objects
+                         .filter(author__in=by_author.keys() - heavy)
+                         .values_list('user', 'author')):
+        followers.setdefault(author, []).append(user)
+    Inbox.objects.bulk_create(
+        (Inbox(user_id=user, post_id=pk, author_id=author,
+               pub_date=pub_date)
+         for author, users in followers.items()
+         for pk, pub_date in by_author[author]
+         for user in users),
+        ignore_conflicts=True,
+    )
+
+
+def comments_created(post_ids):
+    """Работа сигнала comment_saved: счетчики комментариев и ленты,
+    где видны эти посты."""
+    counters.recount_posts(post_ids)
+    for post in Post.objects.filter(pk__in=post_ids).only(
+            'author', 'group', 'text'):
+        caching.bump_post_feeds(post)
+
+
+def reset_sequences(*models):
+    """После вставки с явными id: в SQLite не нужно, в базах
+    с последовательностями они иначе отстанут от данных."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,85 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Post, PostTag
+from .tags import extract_tags
+
+GENERATION_PREFIX = 'feed-gen'
+
+
+def generation_key(scope, pk=None):
+    return f'{GENERATION_PREFIX}:{scope}:{pk}'
+
+
+def get_generations(scopes):
+    """Текущие поколения лент. Пропавший из кэша счетчик заводим заново
+    от текущего времени, чтобы не попасть на старые фрагменты."""
+    keys = [generation_key(*scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(scope, pk=None):
+    """Сдвигает поколение ленты: все ее закэшированные страницы устаревают."""
+    key = generation_key(scope, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_post_feeds(post, old_group_id=None, old_tags=()):
+    """Сдвигает поколения всех лент, где виден пост."""
+    bump('index')
+    bump('author', post.author_id)
+    for group_id in {post.group_id, old_group_id}:
+        if group_id is not None:
+            bump('group', group_id)
+    for tag in extract_tags(post.text) | set(old_tags):
+        bump('tag', tag)
+
+
+def bump_posts_feeds(posts):
+    """Сдвигает поколения всех лент, где видны посты queryset posts.
+    Для редких правок, которые меняют вид многих карточек сразу."""
+    bump('index')
+    posts = posts.order_by()
+    for author_id in posts.values_list('author_id', flat=True).distinct():
+        bump('author', author_id)
+    for group_id in (posts.exclude(group=None)
+                     .values_list('group_id', flat=True).distinct()):
+        bump('group', group_id)
+    for tag in (PostTag.objects.filter(post__in=posts).order_by()
+                .values_list('tag', flat=True).distinct()):
+        bump('tag', tag)
+
+
+def bump_post_feeds_by_id(post_id):
+    """То же по id поста; если пост уже удален, его ленты уже сброшены."""
+    post = (
+        Post.objects.filter(pk=post_id)
+        .only('author', 'group', 'text').first()
+    )
+    if post is not None:
+        bump_post_feeds(post)
+
+
+def feed_cache(request, *scopes):
+    """Параметры для {% cache %} страницы ленты.
+    Ключ меняется вместе с поколениями лент и позицией на ленте."""
+    generations = get_generations(scopes)
+    parts = [
+        '.'.join(map(str, scope)) + f'={generation}'
+        for scope, generation in zip(scopes, generations)
+    ]
+    parts.append(request.GET.get('cursor') or request.GET.get('page') or '')
+    return {
+        'key': ':'.join(parts),
+        'timeout': settings.FEED_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,144 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Comment, Follow, Group, MediaBlob, Post, User, UserStats
+
+
+def change(queryset, field, delta):
+    """Атомарно сдвигает счетчик: UPDATE ... SET field = field + delta.
+    Уйти в минус не дает: такой разъезд чинит команда recount."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    # нет строки - нечего менять, она посчитается при первом чтении
+    change(UserStats.objects.filter(user_id=user_id), field, delta)
+
+
+def change_group(group_id, delta):
+    if group_id is not None:
+        change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post(post_id, delta):
+    if post_id is not None:
+        change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def change_blob(name, delta):
+    """Сдвигает число ссылок на файл картинки; строка заводится
+    при первой ссылке."""
+    if not name:
+        return
+    if delta > 0:
+        MediaBlob.objects.get_or_create(name=name)
+    blobs = MediaBlob.objects.filter(name=name)
+    if delta < 0:
+        blobs = blobs.filter(refcount__gte=-delta)
+    blobs.update(refcount=F('refcount') + delta, changed_at=timezone.now())
+
+
+def count_subquery(queryset, field):
+    """Подзапрос COUNT(*) по queryset, сгруппированному по field."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def user_counts(user_ids):
+    """Счетчики пользователей, посчитанные по таблицам."""
+    return (
+        User.objects.filter(pk__in=user_ids)
+        .annotate(
+            posts_total=count_subquery(Post.objects, 'author'),
+            followers_total=count_subquery(Follow.objects, 'author'),
+            following_total=count_subquery(Follow.objects, 'user'),
+        )
+        .values_list(
+            'pk', 'posts_total', 'followers_total', 'following_total')
+    )
+
+
+def get_user_stats(user):
+    """Счетчики пользователя; при первом обращении считаются по таблицам."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        pass
+    stats = create_user_stats(user.pk)
+    stats.user = user
+    return stats
+
+
+def create_user_stats(user_id):
+    """Заводит строку счетчиков по таблицам, если ее еще нет."""
+    _, posts, followers, following = user_counts([user_id])[0]
+    stats, _ = UserStats.objects.get_or_create(
+        user_id=user_id,
+        defaults={
+            'posts_count': posts,
+            'followers_count': followers,
+            'following_count': following,
+        },
+    )
+    return stats
+
+
+def post_created(post):
+    change_user(post.author_id, 'posts_count', 1)
+    change_group(post.group_id, 1)
+    change_blob(post.image.name, 1)
+
+
+def post_moved(old_group_id, new_group_id):
+    if old_group_id != new_group_id:
+        change_group(old_group_id, -1)
+        change_group(new_group_id, 1)
+
+
+def post_image_changed(old_image, new_image):
+    if old_image != new_image:
+        change_blob(new_image, 1)
+        change_blob(old_image, -1)
+
+
+def post_deleted(post):
+    change_user(post.author_id, 'posts_count', -1)
+    change_group(post.group_id, -1)
+    change_blob(post.image.name, -1)
+
+
+def follow_changed(follow, delta):
+    change_user(follow.author_id, 'followers_count', delta)
+    change_user(follow.user_id, 'following_count', delta)
+
+
+def recount_posts(post_ids):
+    """Пересчитывает comments_count у переданных постов."""
+    Post.objects.filter(pk__in=post_ids).update(
+        comments_count=count_subquery(Comment.objects, 'post'))
+
+
+def recount_groups(group_ids):
+    Group.objects.filter(pk__in=group_ids).update(
+        posts_count=count_subquery(Post.objects, 'group'))
+
+
+def recount_users(user_ids):
+    """Пересчитывает уже заведенные строки UserStats."""
+    for pk, posts, followers, following in user_counts(user_ids):
+        UserStats.objects.filter(user_id=pk).update(
+            posts_count=posts,
+            followers_count=followers,
+            following_count=following,
+        )
+
+
+def recount_blobs(names):
+    MediaBlob.objects.filter(name__in=names).update(
+        refcount=count_subquery(Post.objects, 'image'))
@@ -0,0 +1,305 @@
+import bisect
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from . import counters
+from .models import Follow, Inbox, Post, PostTag, UserStats
+from .utils import (
+    BACKWARD, KeysetPaginator, get_paginators_page, seek
+)
+
+
+def heavy_author_ids(authors):
+    """Из переданных авторов оставляет «тяжелых»: их посты в ленты
+    не раскладываются, а подмешиваются при чтении. Это флаг
+    UserStats.heavy по первичному ключу, подписки не агрегируются."""
+    return set(
+        UserStats.objects.filter(user__in=authors, heavy=True)
+        .values_list('user_id', flat=True)
+    )
+
+
+def author_followed(author_id):
+    """Автор становится «тяжелым», когда подписчиков набралось
+    INBOX_FANOUT_LIMIT. Уже разложенные посты остаются в лентах,
+    повторы при слиянии отбрасываются."""
+    if not UserStats.objects.filter(user_id=author_id).exists():
+        # счетчик ведется только у заведенных строк
+        counters.create_user_stats(author_id)
+    UserStats.objects.filter(
+        user_id=author_id, heavy=False,
+        followers_count__gte=settings.INBOX_FANOUT_LIMIT,
+    ).update(heavy=True)
+
+
+def author_unfollowed(author_id):
+    """Флаг снимается, когда подписчиков меньше INBOX_FANOUT_RELEASE.
+    Посты, вышедшие, пока автор был «тяжелым», есть только в его ленте,
+    а подмешивать ее больше не будем - раскладываем их подписчикам."""
+    released = UserStats.objects.filter(
+        user_id=author_id, heavy=True,
+        followers_count__lt=settings.INBOX_FANOUT_RELEASE,
+    ).update(heavy=False)
+    if released:
+        fill_follower_inboxes(author_id)
+
+
+def mark_heavy_authors():
+    """Ставит флаги заново по всей таблице подписок, для записей в обход
+    сигналов. Ленты после этого пересобирает rebuild_inboxes."""
+    heavy = set(
+        Follow.objects.values('author')
+        .annotate(followers=Count('pk'))
+        .filter(followers__gte=settings.INBOX_FANOUT_LIMIT)
+        .values_list('author', flat=True)
+    )
+    known = set(UserStats.objects.filter(user_id__in=heavy)
+                .values_list('user_id', flat=True))
+    for author_id in heavy - known:
+        counters.create_user_stats(author_id)
+    UserStats.objects.filter(heavy=True).exclude(
+        user_id__in=heavy).update(heavy=False)
+    UserStats.objects.filter(user_id__in=heavy).update(heavy=True)
+    return heavy
+
+
+def latest_post_keys(author_id):
+    """(id, дата) последних INBOX_BACKFILL постов автора."""
+    return list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-pk')
+        .values_list('pk', 'pub_date')[:settings.INBOX_BACKFILL]
+    )
+
+
+def fill_follower_inboxes(author_id, chunk_size=1000):
+    """Кладет последние посты автора в ленты всех его подписчиков."""
+    posts = latest_post_keys(author_id)
+    followers = (
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    Inbox.objects.bulk_create(
+        (Inbox(user_id=user_id,
+               post_id=pk,
+               author_id=author_id,
+               pub_date=pub_date)
+         for user_id in followers
+         for pk, pub_date in posts),
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_post(post, chunk_size=1000):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if heavy_author_ids([post.author_id]):
+        return
+    followers = (
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    # размер пачки INSERT выбирает бэкенд: SQLite не берет больше
+    # 500 строк в одном составном SELECT
+    Inbox.objects.bulk_create(
+        (Inbox(user_id=user_id,
+               post_id=post.pk,
+               author_id=post.author_id,
+               pub_date=post.pub_date)
+         for user_id in followers),
+        ignore_conflicts=True,
+    )
+
+
+def backfill_inbox(user_id, author_id):
+    """Кладет в ленту свежие посты автора, на которого только что
+    подписались."""
+    if heavy_author_ids([author_id]):
+        return
+    Inbox.objects.bulk_create(
+        [Inbox(user_id=user_id,
+               post_id=pk,
+               author_id=author_id,
+               pub_date=pub_date)
+         for pk, pub_date in latest_post_keys(author_id)],
+        ignore_conflicts=True,
+    )
+
+
+def prune_inbox(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    Inbox.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def timeline_key(author_id):
+    return f'timeline:{author_id}'
+
+
+def get_timeline(author_id):
+    """Ключи (дата, id) последних TIMELINE_SIZE постов автора
+    по возрастанию. Список живет в кэше и сбрасывается сигналами."""
+    key = timeline_key(author_id)
+    keys = cache.get(key)
+    if keys is None:
+        keys = list(
+            Post.objects.filter(author_id=author_id)
+            .order_by('-pub_date', '-pk')
+            .values_list('pub_date', 'pk')[:settings.TIMELINE_SIZE]
+        )
+        keys.reverse()
+        cache.set(key, keys, settings.TIMELINE_CACHE_TIMEOUT)
+    return keys
+
+
+def timeline_add(post):
+    # не get + insort + set: из двух одновременных постов
+    # один потерялся бы до истечения кэша. Окно соберется заново
+    cache.delete(timeline_key(post.author_id))
+
+
+def timeline_remove(post):
+    key = timeline_key(post.author_id)
+    keys = cache.get(key)
+    if keys is None:
+        return
+    if (post.pub_date, post.pk) in keys:
+        # окно могло стать неполным - пусть соберется заново
+        cache.delete(key)
+
+
+def timeline_keys(author_id, direction, position, limit):
+    """До limit ключей ленты автора после позиции курсора, в порядке
+    выдачи. Если кэш короче, чем нужно, дочитываем из базы."""
+    keys = get_timeline(author_id)
+    # в полном кэше только последние посты, старые есть лишь в базе
+    full = len(keys) >= settings.TIMELINE_SIZE
+    if direction == BACKWARD:
+        start = 0 if position is None else bisect.bisect_right(
+            keys, position)
+        if start == 0 and full:
+            # курсор старше окна кэша: посты между ними только в базе
+            return seek_timeline(author_id, direction, position, limit)
+        return keys[start:start + limit]
+
+    end = len(keys) if position is None else bisect.bisect_left(
+        keys, position)
+    if end < limit and full:
+        # дальше окна кэша
+        return seek_timeline(author_id, direction, position, limit)
+    return keys[max(end - limit, 0):end][::-1]
+
+
+def seek_timeline(author_id, direction, position, limit):
+    return list(seek(
+        Post.objects.filter(author_id=author_id),
+        direction, position, limit,
+    ).values_list('pub_date', 'pk'))
+
+
+class TimelinePaginator(KeysetPaginator):
+    """Листает ленту постов по ключам (дата, id), выбирая из них ровно
+    одну страницу. Посты читаются из базы только те, что показываем."""
+
+    def __init__(self, author_ids, per_page):
+        super().__init__(Post.objects.all(), per_page)
+        self.author_ids = author_ids
+
+    def streams(self, direction, position, limit):
+        """Отсортированные в порядке выдачи источники ключей."""
+        return [
+            timeline_keys(author_id, direction, position, limit)
+            for author_id in self.author_ids
+        ]
+
+    def fetch(self, direction, position):
+        limit = self.per_page + 1
+        merged = heapq.merge(
+            *self.streams(direction, position, limit),
+            reverse=direction != BACKWARD,
+        )
+        page_keys = []
+        seen = set()
+        for _, pk in merged:
+            if pk in seen:
+                continue
+            seen.add(pk)
+            page_keys.append(pk)
+            if len(page_keys) == limit:
+                break
+
+        # порядок уже задан ключами, сортировка в базе не нужна
+        posts = (
+            Post.objects.select_related('author', 'group')
+            .order_by().in_bulk(page_keys)
+        )
+        return [posts[pk] for pk in page_keys if pk in posts]
+
+
+class FollowPaginator(TimelinePaginator):
+    """Страница подписок: диапазон из Inbox пользователя, слитый с лентами
+    «тяжелых» авторов, которые подмешиваются при чтении."""
+
+    def __init__(self, user, per_page):
+        followed = Follow.objects.filter(user=user).values('author')
+        super().__init__(heavy_author_ids(followed), per_page)
+        self.user = user
+
+    def streams(self, direction, position, limit):
+        inbox = seek(
+            Inbox.objects.filter(user=self.user),
+            direction, position, limit,
+            pk_field='post_id',
+        ).values_list('pub_date', 'post_id')
+        return [inbox] + super().streams(direction, position, limit)
+
+
+class TagPaginator(KeysetPaginator):
+    """Лента хэштега: ключи (дата, id) из индекса PostTag, затем
+    in_bulk за постами страницы. Текст постов не просматривается."""
+
+    def __init__(self, tag, per_page):
+        super().__init__(PostTag.objects.filter(tag=tag), per_page)
+
+    def fetch(self, direction, position):
+        page_keys = list(seek(
+            self.object_list, direction, position, self.per_page + 1,
+            pk_field='post_id',
+        ).values_list('post_id', flat=True))
+        posts = (
+            Post.objects.select_related('author', 'group')
+            .order_by().in_bulk(page_keys)
+        )
+        return [posts[pk] for pk in page_keys if pk in posts]
+
+
+def get_profile_page(request, author):
+    """Страница постов автора из его закэшированной ленты."""
+    cursor = request.GET.get('cursor')
+    if request.GET.get('page') and not cursor:
+        posts = author.posts.select_related('group').all()
+        return get_paginators_page(posts, request)
+
+    paginator = TimelinePaginator([author.pk], settings.NUMBER_OF_POSTS)
+    return paginator.get_cursor_page(cursor)
+
+
+def get_follow_page(request):
+    """Страница ленты подписок текущего пользователя."""
+    cursor = request.GET.get('cursor')
+    if request.GET.get('page') and not cursor:
+        # старые ссылки ?page=N идут мимо ленты, обычным запросом
+        posts = Post.objects.filter(author__following__user=request.user)
+        return get_paginators_page(posts, request)
+
+    paginator = FollowPaginator(request.user, settings.NUMBER_OF_POSTS)
+    return paginator.get_cursor_page(cursor)
+
+
+def get_tag_page(request, tag):
+    """Страница ленты хэштега."""
+    paginator = TagPaginator(tag, settings.NUMBER_OF_POSTS)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
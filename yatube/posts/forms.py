@@ -8,9 +8,51 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # файлы, отброшенные ImageUploadHandler еще при загрузке:
+        # полю не отдаем, а причину показываем в clean()
+        self.upload_errors = {
+            name: file.upload_error
+            for name, file in self.files.items()
+            if getattr(file, 'upload_error', None)
+        }
+        if self.upload_errors:
+            self.files = self.files.copy()
+            for name in self.upload_errors:
+                del self.files[name]
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            # размеры уже известны из заголовка (ImageUploadHandler),
+            # цвет и превью досчитает фоновая обработка картинки
+            image = self.cleaned_data.get('image')
+            size = getattr(image, 'image_size', None) or (None, None)
+            self.instance.image_width, self.instance.image_height = size
+            self.instance.image_color = self.instance.image_lqip = ''
+        return super().save(commit)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for name, error in self.upload_errors.items():
+            self.add_error(name, error)
+        return cleaned_data
+
 
 class CommentForm(forms.ModelForm):
 
     class Meta:
         model = Comment
         fields = ('text',)
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Найти', max_length=200, required=False)
+    order = forms.ChoiceField(
+        label='Сначала',
+        choices=(('rank', 'самые подходящие'), ('new', 'самые новые')),
+        required=False,
+    )
+
+    def clean_order(self):
+        return self.cleaned_data['order'] or 'rank'
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+EMPTY_VALUE = cached_db_kvstore.EMPTY_VALUE
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """Key-value хранилище sorl с двумя уровнями кэша перед таблицей:
+    LRU в памяти процесса и общий кэш (THUMBNAIL_CACHE).
+
+    Записи о миниатюрах не меняются после генерации, поэтому в LRU
+    держим только найденные значения; промахи помнит общий кэш, и
+    генерация в любом процессе перезаписывает их (write-through).
+    Удаление в другом процессе (gc_blobs) LRU не видит, поэтому записи
+    живут в нем не дольше THUMBNAIL_LOCAL_CACHE_TIMEOUT.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    def local_set(self, key, value):
+        expires = time.monotonic() + settings.THUMBNAIL_LOCAL_CACHE_TIMEOUT
+        with self.lock:
+            self.local[key] = (value, expires)
+            self.local.move_to_end(key)
+            while len(self.local) > settings.THUMBNAIL_LOCAL_CACHE_SIZE:
+                self.local.popitem(last=False)
+
+    def get_many_raw(self, keys):
+        """Значения по ключам: сначала LRU, потом один get_many общего
+        кэша и один запрос к таблице на то, чего нет ни там, ни там."""
+        found = {}
+        rest = []
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                value, expires = self.local.get(key, (None, 0))
+                if expires > now:
+                    self.local.move_to_end(key)
+                    found[key] = value
+                else:
+                    rest.append(key)
+        if not rest:
+            return found
+
+        cached = self.cache.get_many(rest)
+        missed = [key for key in rest if key not in cached]
+        if missed:
+            rows = dict(
+                KVStoreModel.objects.filter(key__in=missed)
+                .values_list('key', 'value')
+            )
+            fetched = {key: rows.get(key, EMPTY_VALUE) for key in missed}
+            self.cache.set_many(
+                fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            cached.update(fetched)
+        for key, value in cached.items():
+            if value != EMPTY_VALUE:
+                found[key] = value
+                self.local_set(key, value)
+        return found
+
+    def get_many(self, image_files):
+        """Записи для пачки картинок за одно обращение к каждому уровню.
+        Возвращает список в том же порядке, None - записи нет."""
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        found = self.get_many_raw(keys)
+        return [
+            deserialize_image_file(found[key]) if key in found else None
+            for key in keys
+        ]
+
+    def _get_raw(self, key):
+        return self.get_many_raw([key]).get(key)
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.local_set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        with self.lock:
+            for key in keys:
+                self.local.pop(key, None)
+
+    def clear(self, delete_thumbnails=False):
+        with self.lock:
+            self.local.clear()
+        super().clear(delete_thumbnails)
@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.utils import FORWARD, encode_cursor
+
+User = get_user_model()
+TEMP_B_TREE = 'USE TEMP B-TREE'
+
+
+class Command(BaseCommand):
+    help = ('Проходит по страницам posts/views.py и печатает '
+            'EXPLAIN QUERY PLAN для каждого их запроса к таблицам постов.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('# EXPLAIN QUERY PLAN страниц posts/views.py\n')
+        self.stdout.write(
+            'Собрано командой `python manage.py explain_views`. '
+            f'В планах лент не должно быть `{TEMP_B_TREE}`.\n')
+        with transaction.atomic():
+            urls = self.make_fixtures()
+            cache.clear()
+            for title, url in urls:
+                self.explain_url(title, url)
+            # данные были нужны только для обхода страниц
+            transaction.set_rollback(True)
+        cache.clear()
+
+    def make_fixtures(self):
+        reader = User.objects.create_user(username='explain_reader')
+        author = User.objects.create_user(username='explain_author')
+        group = Group.objects.create(
+            title='Explain', slug='explain-views', description='Explain')
+        post = Post.objects.create(
+            author=author, group=group, text='Пост #explain')
+        Comment.objects.create(author=reader, post=post, text='Коммент')
+        Follow.objects.create(user=reader, author=author)
+
+        self.client = Client()
+        self.client.force_login(reader)
+        cursor = '?cursor=' + encode_cursor(FORWARD, post.pub_date, post.pk)
+        return (
+            ('index', reverse('posts:index')),
+            ('index, следующая страница', reverse('posts:index') + cursor),
+            ('group_posts',
+             reverse('posts:group_list', args=[group.slug])),
+            ('group_posts, следующая страница',
+             reverse('posts:group_list', args=[group.slug]) + cursor),
+            ('profile', reverse('posts:profile', args=[author.username])),
+            ('post_detail', reverse('posts:post_detail', args=[post.pk])),
+            ('follow_index', reverse('posts:follow_index')),
+            ('follow_index, следующая страница',
+             reverse('posts:follow_index') + cursor),
+            ('tag_posts', reverse('posts:tag_posts', args=['explain'])),
+            ('tag_posts, следующая страница',
+             reverse('posts:tag_posts', args=['explain']) + cursor),
+            # поиска здесь нет: выдача и по рангу, и по дате сортирует
+            # найденное, без сортировки FTS5 отдает только порядок id
+        )
+
+    def explain_url(self, title, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        self.stdout.write(f'## {title}: `{url}`\n')
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or '"posts_' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            self.stdout.write('```sql')
+            self.stdout.write(sql)
+            self.stdout.write('```')
+            for step in plan:
+                self.stdout.write(f'    {step}')
+            self.stdout.write('')
@@ -0,0 +1,158 @@
+import bz2
+import gzip
+import lzma
+import os
+import sys
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Comment, Follow, Group, Post
+from posts.utils import JSON_ENCODER
+
+# что выгружать: модель, тип записи, (поле записи, поле values_list)
+# и поле даты для --since. Первым всегда id: по нему идут окна
+EXPORTS = {
+    'groups': (Group, 'group', (
+        ('id', 'pk'), ('slug', 'slug'), ('title', 'title'),
+        ('description', 'description'),
+    ), None),
+    'posts': (Post, 'post', (
+        ('id', 'pk'), ('author', 'author__username'),
+        ('group', 'group__slug'), ('text', 'text'),
+        ('pub_date', 'pub_date'), ('updated_at', 'updated_at'),
+        ('image', 'image'),
+    ), 'updated_at'),
+    'comments': (Comment, 'comment', (
+        ('id', 'pk'), ('post', 'post_id'), ('author', 'author__username'),
+        ('text', 'text'), ('created', 'created'),
+    ), 'created'),
+    'follows': (Follow, 'follow', (
+        ('id', 'pk'), ('user', 'user__username'),
+        ('author', 'author__username'),
+    ), None),
+}
+COMPRESSORS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+SUFFIXES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+
+
+@contextmanager
+def open_output(path, compress):
+    if path == '-':
+        if compress is None:
+            yield sys.stdout
+            return
+        with COMPRESSORS[compress](sys.stdout.buffer, 'wt',
+                                   encoding='utf-8') as file:
+            yield file
+        return
+    opener = COMPRESSORS.get(compress, open)
+    with opener(path, 'wt', encoding='utf-8') as file:
+        yield file
+
+
+def keyset_rows(queryset, last, size):
+    """Строки с id до last окнами по size: каждое окно - отдельный
+    короткий запрос от последнего id, без OFFSET, и читается
+    через iterator(), не целиком в память."""
+    position = 0
+    while True:
+        count = 0
+        window = (queryset.filter(pk__gt=position, pk__lte=last)
+                  .order_by('pk')[:size])
+        for row in window.iterator():
+            count += 1
+            position = row[0]
+            yield row
+        if count < size:
+            return
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в NDJSON, '
+        'по строке JSON с полем type на запись. С --since - только '
+        'посты, измененные с этого момента, и комментарии, оставленные '
+        'с него; группы и подписки без дат выгружаются целиком. '
+        'Удаления в выгрузку не попадают. Файл загружается командой '
+        'import_posts; пользователей она заводит с --create-authors.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            nargs='?',
+            default='-',
+            help='Файл; - или без аргумента - stdout',
+        )
+        parser.add_argument(
+            '--compress',
+            choices=COMPRESSORS,
+            help='Сжатие (по умолчанию по расширению .gz, .bz2, .xz)',
+        )
+        parser.add_argument(
+            '--since',
+            help='Дата ISO 8601: выгрузить только новое с этого момента',
+        )
+        parser.add_argument(
+            '--models',
+            nargs='+',
+            choices=EXPORTS,
+            default=list(EXPORTS),
+        )
+        parser.add_argument(
+            '--window-size',
+            type=int,
+            default=10000,
+            help='Строк в одном запросе',
+        )
+
+    def handle(self, *args, **options):
+        path = options['output']
+        compress = options['compress']
+        if compress is None and path != '-':
+            compress = SUFFIXES.get(os.path.splitext(path)[1])
+        since = self.parse_since(options['since'])
+        # отсчет для следующей выгрузки - до чтения: что изменится
+        # во время выгрузки, попадет и в следующую
+        started = timezone.now()
+        counts = {}
+        with open_output(path, compress) as file:
+            for name in options['models']:
+                counts[name] = self.export(
+                    file, name, since, options['window_size'])
+        # stdout может быть занят самой выгрузкой
+        self.stderr.write(', '.join(
+            f'{name}: {count}' for name, count in counts.items()))
+        self.stderr.write(
+            f'Следующая выгрузка: --since {started.isoformat()}')
+
+    def parse_since(self, value):
+        if value is None:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            raise CommandError(f'Неверная дата --since: {value}')
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def export(self, file, name, since, size):
+        model, kind, fields, date_field = EXPORTS[name]
+        keys = [key for key, _ in fields]
+        queryset = model.objects.values_list(*[field for _, field in fields])
+        if since is not None and date_field is not None:
+            queryset = queryset.filter(**{f'{date_field}__gte': since})
+        # строки, добавленные во время выгрузки, не гонят ее дальше
+        last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        count = 0
+        for row in keyset_rows(queryset, last, size):
+            record = {'type': kind}
+            record.update(zip(keys, row))
+            file.write(JSON_ENCODER.encode(record))
+            file.write('\n')
+            count += 1
+        return count
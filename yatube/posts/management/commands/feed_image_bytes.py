@@ -0,0 +1,83 @@
+import json
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import get_ready_thumbnail
+
+
+def pick_variant(variants, accept, needed_width):
+    """Что выберет браузер: лучший из принимаемых форматов и самая узкая
+    ширина не меньше нужной (или самая широкая, если таких нет)."""
+    for fmt in settings.POST_IMAGE_FORMATS:
+        if fmt in accept and fmt in variants:
+            candidates = sorted(variants[fmt])
+            for width, name, size in candidates:
+                if width >= needed_width:
+                    return fmt, width, size
+            width, name, size = candidates[-1]
+            return fmt, width, size
+    return None
+
+
+class Command(BaseCommand):
+    help = ('Считает байты картинок первой страницы главной ленты: '
+            'одна миниатюра 960x339 против вариантов из srcset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--viewport',
+            type=int,
+            default=390,
+            help='Ширина экрана в CSS-пикселях',
+        )
+        parser.add_argument(
+            '--dpr',
+            type=float,
+            default=2,
+            help='Плотность пикселей экрана',
+        )
+        parser.add_argument(
+            '--accept',
+            default=','.join(settings.POST_IMAGE_FORMATS),
+            help='Форматы, которые принимает браузер, через запятую',
+        )
+
+    def handle(self, *args, **options):
+        accept = options['accept'].upper().split(',')
+        css_width = min(options['viewport'], settings.POST_IMAGE_RATIO[0])
+        needed_width = round(css_width * options['dpr'])
+        posts = (
+            Post.objects.exclude(image='')
+            .only('image', 'image_variants')[:settings.NUMBER_OF_POSTS]
+        )
+
+        before = after = 0
+        rows = []
+        for post in posts:
+            thumbnail = get_ready_thumbnail(post.image, 'card')
+            card_size = (
+                default_storage.size(thumbnail.name) if thumbnail else 0)
+            picked = None
+            if post.image_variants:
+                variants = json.loads(post.image_variants)['sources']
+                picked = pick_variant(variants, accept, needed_width)
+            variant_size = picked[2] if picked else card_size
+            before += card_size
+            after += variant_size
+            choice = f'{picked[0]} {picked[1]}w' if picked else 'миниатюра'
+            rows.append((post.pk, card_size, variant_size, choice))
+
+        self.stdout.write(
+            f'Экран {options["viewport"]}px x{options["dpr"]:g}, '
+            f'нужна ширина {needed_width}px, форматы {",".join(accept)}\n')
+        self.stdout.write('| пост | до, байт | после, байт | вариант |')
+        self.stdout.write('|---|---|---|---|')
+        for row in rows:
+            self.stdout.write('| {} | {} | {} | {} |'.format(*row))
+        saved = 100 * (before - after) / before if before else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'\nНа страницу: до {before} байт, после {after} байт '
+            f'({saved:.0f}% меньше)'))
@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.caching import bump
+from posts.models import Post
+from posts.tags import extract_tags
+from posts.variants import describe_image
+
+FIELDS = ('image_width', 'image_height', 'image_color', 'image_lqip')
+
+
+def describe(name):
+    try:
+        return describe_image(
+            os.path.join(settings.MEDIA_ROOT, name),
+            settings.POST_IMAGE_RATIO,
+            settings.POST_IMAGE_LQIP_WIDTH,
+        )
+    except Exception as error:
+        return error
+
+
+class Command(BaseCommand):
+    help = ('Заполняет размеры, основной цвет и превью картинок постов, '
+            'у которых их еще нет. Картинки разбираются в пуле процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Сколько процессов разбирают картинки',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Сколько постов обновлять в одной транзакции',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать и уже заполненные посты',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.exclude(image='').order_by('pk')
+        if not options['all']:
+            posts = posts.filter(image_color='')
+        posts = posts.only('pk', 'image', 'author', 'group', 'text')
+
+        done = failed = 0
+        authors, groups, tags = set(), set(), set()
+        last_pk = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                # окна по первичному ключу, а не OFFSET
+                batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                names = [post.image.name for post in batch]
+                now = timezone.now()
+                updated = []
+                for post, info in zip(batch, pool.map(describe, names)):
+                    if isinstance(info, Exception):
+                        failed += 1
+                        self.stderr.write(f'{post.image.name}: {info}')
+                        continue
+                    for field, value in info.items():
+                        setattr(post, field, value)
+                    # новый updated_at дает карточкам поста новый ключ
+                    post.updated_at = now
+                    updated.append(post)
+                    authors.add(post.author_id)
+                    groups.add(post.group_id)
+                    tags.update(extract_tags(post.text))
+                with transaction.atomic():
+                    Post.objects.bulk_update(
+                        updated, FIELDS + ('updated_at',))
+                done += len(updated)
+
+        if done:
+            self.bump_feeds(authors, groups, tags)
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено: {done}, не удалось: {failed}'))
+
+    @staticmethod
+    def bump_feeds(authors, groups, tags):
+        """Сбрасывает ленты, где видны обновленные посты."""
+        bump('index')
+        for author_id in authors:
+            bump('author', author_id)
+        for group_id in groups - {None}:
+            bump('group', group_id)
+        for tag in tags:
+            bump('tag', tag)
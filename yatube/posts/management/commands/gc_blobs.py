@@ -0,0 +1,95 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import counters
+from posts.models import MediaBlob, Post
+from posts.thumbnails import delete_image_files
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы картинок, на которые не ссылается ни один пост, '
+            'вместе с их миниатюрами и вариантами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов удалять за один проход',
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы, которые были нужны меньше N секунд назад',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что было бы удалено',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timezone.timedelta(seconds=options['grace'])
+        storage = Post._meta.get_field('image').storage
+        unused = (
+            MediaBlob.objects.filter(refcount=0, changed_at__lt=cutoff)
+            .order_by('name').values_list('name', flat=True)
+        )
+
+        removed = kept = 0
+        last_name = ''
+        while True:
+            # окна по первичному ключу, а не OFFSET
+            names = list(unused.filter(name__gt=last_name)[:batch_size])
+            if not names:
+                break
+            last_name = names[-1]
+
+            # счетчик мог разъехаться: на такие файлы ссылки еще есть
+            referenced = set(
+                Post.objects.filter(image__in=names)
+                .values_list('image', flat=True)
+            )
+            if referenced and not dry_run:
+                counters.recount_blobs(referenced)
+            names = [name for name in names if name not in referenced]
+            kept += len(referenced)
+            if dry_run:
+                for name in names:
+                    self.stdout.write(name)
+                removed += len(names)
+                continue
+
+            with transaction.atomic():
+                MediaBlob.objects.filter(name__in=names, refcount=0).delete()
+            for name in names:
+                if self.recently_used(storage, name, cutoff):
+                    # тот же файл только что загрузили заново
+                    kept += 1
+                    continue
+                self.remove(storage, name)
+                removed += 1
+
+        verb = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {removed}, оставлено: {kept}'))
+
+    @staticmethod
+    def recently_used(storage, name, cutoff):
+        try:
+            modified = os.stat(storage.path(name)).st_mtime
+        except FileNotFoundError:
+            return False
+        return modified >= cutoff.timestamp()
+
+    @staticmethod
+    def remove(storage, name):
+        delete_image_files(name)
+        storage.delete(name)
@@ -0,0 +1,206 @@
+import hashlib
+import os
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import MediaBlob, Post
+from posts.thumbnails import delete_image_files, thumbnail_names
+from posts.variants import variants_dir
+
+
+def digest(name):
+    return int.from_bytes(
+        hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big')
+
+
+class NameSet:
+    """Множество имен файлов по 8 байт на имя: отсортированные прогоны
+    64-битных хэшей в array. Коллизия хэшей может только оставить
+    лишний файл, но не удалить нужный."""
+
+    def __init__(self, run_size):
+        self.run_size = run_size
+        self.runs = []
+        self.pending = []
+
+    def add(self, name):
+        self.pending.append(digest(name))
+        if len(self.pending) >= self.run_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.pending.sort()
+            self.runs.append(array('Q', self.pending))
+            self.pending = []
+
+    def __contains__(self, name):
+        value = digest(name)
+        for run in self.runs:
+            index = bisect_left(run, value)
+            if index < len(run) and run[index] == value:
+                return True
+        return False
+
+    def __len__(self):
+        return sum(map(len, self.runs)) + len(self.pending)
+
+
+def walk_files(root, top):
+    """Файлы каталога top внутри root: (имя от root, DirEntry).
+    os.scandir без рекурсии в памяти: стек только из каталогов."""
+    stack = [os.path.join(root, top)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, root)
+                    yield name.replace(os.sep, '/'), entry
+
+
+def unlink_all(paths):
+    removed = size = 0
+    for path, file_size in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        size += file_size
+    return removed, size
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из MEDIA_ROOT картинки, миниатюры и варианты, '
+            'на которые не ссылается ни один пост.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только отчет: что и сколько было бы удалено',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Сколько потоков удаляют файлы',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов отдавать потоку за раз',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='По сколько строк читать Post.image из базы',
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы моложе N секунд',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.workers = options['workers']
+        self.verbosity = options['verbosity']
+        cutoff = (timezone.now() - timezone.timedelta(
+            seconds=options['grace'])).timestamp()
+
+        keep = self.referenced_names(options['chunk_size'])
+        self.stdout.write(f'Нужных имен: {len(keep)}')
+
+        self.found = {top: [0, 0] for top in settings.MEDIA_GC_DIRS}
+        self.removed = {top: [0, 0] for top in settings.MEDIA_GC_DIRS}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            self.pool = pool
+            self.in_flight = deque()
+            for top in settings.MEDIA_GC_DIRS:
+                batch = []
+                for name, entry in walk_files(settings.MEDIA_ROOT, top):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime >= cutoff or self.needed(name, keep):
+                        continue
+                    self.found[top][0] += 1
+                    self.found[top][1] += stat.st_size
+                    if self.verbosity > 1:
+                        self.stdout.write(name)
+                    if top == 'posts' and not self.dry_run:
+                        # записи sorl и варианты удаляются вместе с картинкой
+                        delete_image_files(name)
+                        MediaBlob.objects.filter(
+                            name=name, refcount=0).delete()
+                    batch.append((entry.path, stat.st_size))
+                    if len(batch) >= self.batch_size:
+                        self.submit(top, batch)
+                        batch = []
+                self.submit(top, batch)
+            while self.in_flight:
+                self.collect()
+        self.report()
+
+    def referenced_names(self, chunk_size):
+        """Картинки постов, их миниатюры и каталоги вариантов."""
+        keep = NameSet(run_size=1000000)
+        images = (
+            Post.objects.exclude(image='').order_by()
+            .values_list('image', flat=True).iterator(chunk_size=chunk_size)
+        )
+        for name in images:
+            keep.add(name)
+            keep.add(variants_dir(name))
+            for thumbnail in thumbnail_names(name):
+                keep.add(thumbnail)
+        keep.flush()
+        return keep
+
+    @staticmethod
+    def needed(name, keep):
+        if name.startswith('variants/'):
+            # варианты нужны всем каталогом
+            return os.path.dirname(name) in keep
+        return name in keep
+
+    def submit(self, top, batch):
+        if not batch or self.dry_run:
+            return
+        # очередь ограничена: файлы не копятся в памяти быстрее удаления
+        while len(self.in_flight) >= self.workers * 2:
+            self.collect()
+        self.in_flight.append((top, self.pool.submit(unlink_all, batch)))
+
+    def collect(self):
+        top, future = self.in_flight.popleft()
+        removed, size = future.result()
+        self.removed[top][0] += removed
+        self.removed[top][1] += size
+
+    def report(self):
+        totals = self.found if self.dry_run else self.removed
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write('| каталог | файлов | байт |')
+        self.stdout.write('|---|---|---|')
+        for top, (count, size) in totals.items():
+            self.stdout.write(f'| {top} | {count} | {size} |')
+        count = sum(count for count, _ in totals.values())
+        size = sum(size for _, size in totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: {count} файлов, {size} байт'))
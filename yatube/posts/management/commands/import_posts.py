@@ -0,0 +1,385 @@
+import gzip
+import json
+import os
+import sys
+from itertools import repeat
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import bulk
+from posts.models import (
+    Comment, Follow, Group, ImportCheckpoint, ImportedRecord, Post
+)
+from posts.thumbnails import generate_thumbnails, get_executor, use_pool
+
+User = get_user_model()
+
+
+class RecordError(ValueError):
+    pass
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def parse_date(value):
+    """Дата из ISO 8601; без часового пояса - в TIME_ZONE,
+    без даты вовсе - сейчас."""
+    if value is None:
+        return timezone.now()
+    date = parse_datetime(value) if isinstance(value, str) else None
+    if date is None:
+        raise RecordError(f'неверная дата {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def source_id(data):
+    """id записи в выгрузке (команда export) или None."""
+    value = data.get('id')
+    if value is not None and not isinstance(value, int):
+        raise RecordError('id должен быть числом')
+    return value
+
+
+def imported_ids(kind, ids):
+    """{id в выгрузке: id в базе} для уже импортированных записей."""
+    return dict(ImportedRecord.objects.filter(
+        kind=kind, source_id__in=ids).values_list('source_id', 'target_id'))
+
+
+def required_text(data, field):
+    value = data.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise RecordError(f'нет поля {field}')
+    return value
+
+
+class Command(BaseCommand):
+    help = (
+        'Импорт постов и комментариев из NDJSON (файл, файл .gz или '
+        'stdin), по строке JSON на запись:\n'
+        '{"author": "leo", "group": "cats", "text": "...", '
+        '"pub_date": "2020-01-31T12:00:00+03:00", "image": "posts/...", '
+        '"comments": [{"author": "...", "text": "...", "created": "..."}]}\n'
+        '{"type": "comment", "post": 42, "author": "...", "text": "..."}\n'
+        'Принимает и вывод команды export. Группы заводятся по slug, '
+        'подписки - по именам пользователей. Записи с полем id '
+        'запоминаются: комментарий с id ссылается на id поста '
+        'в выгрузке, а не в базе, и повторно выгруженные посты '
+        'и комментарии пропускаются (правки уже импортированных '
+        'постов не переносятся). Все выгрузки должны быть из одной базы.\n'
+        'Пишет пачками через bulk_create; позиция сохраняется вместе '
+        'с пачкой, повторный запуск продолжает с нее. Теги, ленты, '
+        'счетчики, кэш и миниатюры обновляются в конце, окнами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            nargs='?',
+            default='-',
+            help='Файл NDJSON; - или без аргумента - stdin',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько записей писать в одной транзакции',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Имя позиции импорта (по умолчанию имя файла)',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать с первой строки, а не с сохраненной позиции',
+        )
+        parser.add_argument(
+            '--create-authors',
+            action='store_true',
+            help='Заводить неизвестных авторов без пароля',
+        )
+        parser.add_argument(
+            '--max-errors',
+            type=int,
+            default=100,
+            help='Остановиться, если неверных записей больше',
+        )
+
+    def handle(self, *args, **options):
+        path = options['input']
+        name = options['checkpoint'] or (
+            'stdin' if path == '-' else os.path.basename(path))
+        self.batch_size = options['batch_size']
+        self.create_authors = options['create_authors']
+        self.max_errors = options['max_errors']
+        self.errors = 0
+        self.written = {'posts': 0, 'comments': 0}
+        # справочники загружаются один раз, а не запросом на запись
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(name=name)
+        if options['restart']:
+            checkpoint.line = 0
+            checkpoint.save(update_fields=['line', 'updated_at'])
+        if checkpoint.line:
+            self.stdout.write(f'Продолжаем {name} со строки '
+                              f'{checkpoint.line + 1}')
+        try:
+            with open_input(path) as stream:
+                self.read(stream, checkpoint)
+        except CommandError:
+            # записанное уже в базе: его побочные эффекты нужны и так
+            self.finish(checkpoint)
+            raise
+        self.finish(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {self.written["posts"]}, комментариев: '
+            f'{self.written["comments"]}, ошибок: {self.errors}'))
+
+    def read(self, stream, checkpoint):
+        start = checkpoint.line
+        batch = []
+        number = 0
+        for number, line in enumerate(stream, 1):
+            # записанные строки только пропускаем, не разбирая
+            if number <= start or not line.strip():
+                continue
+            try:
+                record = self.parse(line)
+            except RecordError as error:
+                self.error(number, error)
+            else:
+                # группы и подписки уже записаны при разборе
+                if record is not None:
+                    batch.append((number, record))
+            if len(batch) >= self.batch_size:
+                self.write(checkpoint, batch, number)
+                batch = []
+        if number > checkpoint.line:
+            self.write(checkpoint, batch, number)
+
+    def error(self, number, error):
+        self.errors += 1
+        self.stderr.write(f'Строка {number}: {error}')
+        if self.errors > self.max_errors:
+            raise CommandError(
+                f'Неверных записей больше {self.max_errors}. Повторный '
+                f'запуск продолжит импорт с первой незаписанной строки')
+
+    def parse(self, line):
+        try:
+            data = json.loads(line)
+        except ValueError as error:
+            raise RecordError(f'не JSON: {error}')
+        if not isinstance(data, dict):
+            raise RecordError('запись должна быть объектом JSON')
+        kind = data.get('type', 'post')
+        if kind == 'post':
+            comments = data.get('comments') or []
+            if not isinstance(comments, list):
+                raise RecordError('comments должен быть списком')
+            return kind, self.post_fields(data), [
+                self.comment_fields(comment) for comment in comments
+                if isinstance(comment, dict)
+            ], source_id(data)
+        if kind == 'comment':
+            post = data.get('post')
+            if not isinstance(post, int):
+                raise RecordError('нет id поста в поле post')
+            return kind, post, self.comment_fields(data), source_id(data)
+        if kind == 'group':
+            self.group(data)
+            return None
+        if kind == 'follow':
+            self.follow(data)
+            return None
+        raise RecordError(f'неизвестный тип {kind!r}')
+
+    def group(self, data):
+        slug = required_text(data, 'slug')
+        if slug in self.groups:
+            return
+        group = Group.objects.create(
+            slug=slug,
+            title=required_text(data, 'title'),
+            description=data.get('description') or '',
+        )
+        self.groups[slug] = group.pk
+
+    def follow(self, data):
+        user_id = self.author_id(data.get('user'))
+        author_id = self.author_id(data.get('author'))
+        if user_id == author_id:
+            raise RecordError('подписка на самого себя')
+        # через save(): сигналы ведут счетчики и ленту подписчика
+        Follow.objects.get_or_create(user_id=user_id, author_id=author_id)
+
+    def post_fields(self, data):
+        group = data.get('group')
+        if group is not None and group not in self.groups:
+            raise RecordError(f'нет группы {group!r}')
+        image = data.get('image') or ''
+        if not isinstance(image, str):
+            raise RecordError('image должен быть строкой')
+        return {
+            'author_id': self.author_id(data.get('author')),
+            'group_id': self.groups.get(group),
+            'text': required_text(data, 'text'),
+            'pub_date': parse_date(data.get('pub_date')),
+            'image': image,
+        }
+
+    def comment_fields(self, data):
+        return {
+            'author_id': self.author_id(data.get('author')),
+            'text': required_text(data, 'text'),
+            'created': parse_date(data.get('created')),
+        }
+
+    def author_id(self, username):
+        if not isinstance(username, str) or not username:
+            raise RecordError('нет автора')
+        if username not in self.users:
+            if not self.create_authors:
+                raise RecordError(f'нет пользователя {username!r}')
+            user = User(username=username)
+            user.set_unusable_password()
+            user.save()
+            self.users[username] = user.pk
+        return self.users[username]
+
+    def write(self, checkpoint, batch, line):
+        """Пишет пачку и сдвигает позицию в одной транзакции."""
+        with transaction.atomic():
+            # первая запись берет блокировку записи SQLite: до фиксации
+            # никто не займет id, выбранные ниже
+            ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                line=line, updated_at=timezone.now())
+            posts, comments, imported = self.build(batch)
+            with bulk.manual_dates():
+                Post.objects.bulk_create(posts)
+                Comment.objects.bulk_create(comments)
+            ImportedRecord.objects.bulk_create(imported)
+            ranges = {}
+            for prefix, objects in (('posts', posts),
+                                    ('comments', comments)):
+                if objects:
+                    ranges[f'{prefix}_from'] = Coalesce(
+                        f'{prefix}_from', Value(objects[0].pk))
+                    ranges[f'{prefix}_to'] = objects[-1].pk
+            if ranges:
+                ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                    **ranges)
+        checkpoint.line = line
+        self.written['posts'] += len(posts)
+        self.written['comments'] += len(comments)
+
+    def imported(self, batch):
+        """Уже импортированные посты и комментарии выгрузки, на которые
+        ссылается пачка, и id постов в базе под ее комментариями."""
+        sources = {'post': [], 'comment': []}
+        for _, record in batch:
+            if record[-1] is not None:
+                sources[record[0]].append(record[-1])
+                if record[0] == 'comment':
+                    sources['post'].append(record[1])
+        post_ids = imported_ids('post', sources['post'])
+        existing = set(Post.objects.filter(pk__in=[
+            self.comment_post(record, post_ids)
+            for _, record in batch if record[0] == 'comment'
+        ]).values_list('pk', flat=True))
+        return post_ids, imported_ids('comment', sources['comment']), existing
+
+    def comment_post(self, record, post_ids):
+        # у комментария выгрузки в post - id поста в выгрузке
+        _, post, _, source = record
+        return post if source is None else post_ids.get(post)
+
+    def build(self, batch):
+        """Объекты пачки с id подряд после последних в таблицах:
+        комментариям к новым постам нужны их id до записи. Записи
+        выгрузки, импортированные раньше, пропускаются."""
+        post_ids, comment_ids, existing = self.imported(batch)
+        post_pk = bulk.next_pk(Post)
+        comment_pk = bulk.next_pk(Comment)
+        posts, comments, imported = [], [], []
+        for number, record in batch:
+            if record[0] == 'post':
+                _, fields, nested, source = record
+                if source in post_ids:
+                    continue
+                posts.append(Post(pk=post_pk, **fields))
+                if source is not None:
+                    post_ids[source] = post_pk
+                    existing.add(post_pk)
+                    imported.append(ImportedRecord(
+                        kind='post', source_id=source, target_id=post_pk))
+                targets = [(post_pk, comment, None) for comment in nested]
+                post_pk += 1
+            elif record[-1] in comment_ids:
+                continue
+            elif self.comment_post(record, post_ids) in existing:
+                targets = [(self.comment_post(record, post_ids),
+                            record[2], record[3])]
+            else:
+                self.error(number, f'нет поста {record[1]}')
+                continue
+            for post, fields, source in targets:
+                comments.append(Comment(pk=comment_pk, post_id=post,
+                                        **fields))
+                if source is not None:
+                    comment_ids[source] = comment_pk
+                    imported.append(ImportedRecord(
+                        kind='comment', source_id=source,
+                        target_id=comment_pk))
+                comment_pk += 1
+        return posts, comments, imported
+
+    def finish(self, checkpoint):
+        """Работа сигналов для всего записанного с прошлого finish(),
+        в том числе прерванными запусками."""
+        checkpoint.refresh_from_db()
+        bulk.reset_sequences(Post, Comment)
+        if checkpoint.posts_from is not None:
+            rows = Post.objects.values_list(
+                'pk', 'author_id', 'group_id', 'text', 'pub_date', 'image')
+            for window in bulk.windows(rows, checkpoint.posts_from,
+                                       checkpoint.posts_to, self.batch_size):
+                with transaction.atomic():
+                    bulk.posts_created(window)
+                self.thumbnails({row[-1] for row in window} - {''})
+        if checkpoint.comments_from is not None:
+            rows = Comment.objects.values_list('pk', 'post_id')
+            for window in bulk.windows(rows, checkpoint.comments_from,
+                                       checkpoint.comments_to,
+                                       self.batch_size):
+                with transaction.atomic():
+                    bulk.comments_created({post for _, post in window})
+        ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(
+            posts_from=None, posts_to=None,
+            comments_from=None, comments_to=None)
+
+    def thumbnails(self, names):
+        # окно ждет свои миниатюры: очередь пула не растет без предела
+        if use_pool():
+            list(get_executor().map(generate_thumbnails, names,
+                                    repeat(True)))
+        else:
+            for name in names:
+                generate_thumbnails(name)
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Строит миниатюры всех размеров из POST_THUMBNAILS '
+            'для уже загруженных картинок постов, в несколько потоков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Сколько потоков строят миниатюры',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько картинок отдавать пулу за раз',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        names = (
+            Post.objects.exclude(image='')
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        total = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            batch = []
+            # читаем пачками, чтобы очередь пула не росла без предела
+            for name in names.iterator(chunk_size=batch_size):
+                batch.append(name)
+                if len(batch) >= batch_size:
+                    total += self.run_batch(pool, batch)
+                    batch = []
+            if batch:
+                total += self.run_batch(pool, batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок обработано: {total}'))
+
+    def run_batch(self, pool, names):
+        list(pool.map(generate_thumbnails, names, [True] * len(names)))
+        self.stdout.write(f'... {len(names)}')
+        return len(names)
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.feeds import heavy_author_ids, mark_heavy_authors
+from posts.models import Follow, Inbox, Post
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок (Inbox) пачками читателей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько читателей пересобирать в одной транзакции',
+        )
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help='Пересобрать ленту только этого пользователя',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        readers = Follow.objects.order_by('user').values_list(
+            'user', flat=True).distinct()
+        if options['usernames']:
+            readers = readers.filter(user__username__in=options['usernames'])
+        else:
+            # подписки могли быть записаны в обход сигналов
+            mark_heavy_authors()
+            # у кого не осталось подписок, лента должна быть пустой
+            Inbox.objects.exclude(
+                user__in=Follow.objects.values('user')).delete()
+
+        batch = []
+        total = 0
+        for user_id in readers.iterator():
+            batch.append(user_id)
+            if len(batch) >= batch_size:
+                total += self.rebuild(batch)
+                batch = []
+        if batch:
+            total += self.rebuild(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент пересобрано: {total}'))
+
+    def rebuild(self, user_ids):
+        follows = list(
+            Follow.objects.filter(user_id__in=user_ids)
+            .values_list('user_id', 'author_id')
+        )
+        heavy = heavy_author_ids({author_id for _, author_id in follows})
+        latest = {}
+        entries = []
+        for user_id, author_id in follows:
+            if author_id in heavy:
+                continue
+            if author_id not in latest:
+                latest[author_id] = list(
+                    Post.objects.filter(author_id=author_id)
+                    .order_by('-pub_date', '-pk')
+                    .values_list('pk', 'pub_date')
+                    [:settings.INBOX_BACKFILL]
+                )
+            entries.extend(
+                Inbox(user_id=user_id,
+                      post_id=pk,
+                      author_id=author_id,
+                      pub_date=pub_date)
+                for pk, pub_date in latest[author_id]
+            )
+
+        with transaction.atomic():
+            Inbox.objects.filter(user_id__in=user_ids).delete()
+            # размер пачки выбирает бэкенд: SQLite не берет в один INSERT
+            # больше 500 строк
+            Inbox.objects.bulk_create(entries)
+        self.stdout.write(f'Читателей: {len(user_ids)}, '
+                          f'записей: {len(entries)}')
+        return len(user_ids)
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import counters
+from posts.models import Group, MediaBlob, Post, UserStats
+
+TARGETS = {
+    'posts': (Post.objects, counters.recount_posts),
+    'groups': (Group.objects, counters.recount_groups),
+    'users': (UserStats.objects, counters.recount_users),
+    'blobs': (MediaBlob.objects, counters.recount_blobs),
+}
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счетчики '
+            '(комментарии постов, посты групп, счетчики пользователей, '
+            'ссылки на файлы картинок).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets',
+            nargs='*',
+            help=('Что пересчитать: posts, groups, users, blobs. '
+                  'По умолчанию все'),
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько строк пересчитывать в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        targets = options['targets'] or sorted(TARGETS)
+        unknown = set(targets) - set(TARGETS)
+        if unknown:
+            raise CommandError(f'Неизвестные счетчики: {", ".join(unknown)}')
+        for target in targets:
+            manager, recount = TARGETS[target]
+            ids = manager.order_by('pk').values_list('pk', flat=True)
+            total = 0
+            last_pk = None
+            while True:
+                # окна по первичному ключу, а не OFFSET
+                window = ids if last_pk is None else ids.filter(
+                    pk__gt=last_pk)
+                chunk = list(window[:chunk_size])
+                if not chunk:
+                    break
+                with transaction.atomic():
+                    recount(chunk)
+                total += len(chunk)
+                last_pk = chunk[-1]
+            self.stdout.write(self.style.SUCCESS(
+                f'{target}: пересчитано {total}'))
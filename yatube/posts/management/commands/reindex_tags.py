@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.caching import bump
+from posts.models import Post, PostTag
+from posts.tags import extract_tags
+
+
+class Command(BaseCommand):
+    help = ('Заново разбирает хэштеги постов окнами по id и правит '
+            'PostTag: нужен после массовой загрузки или queryset.update().')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов разбирать в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.order_by('pk').values_list(
+            'pk', 'text', 'pub_date')
+
+        scanned = added = removed = 0
+        touched = set()
+        last_pk = 0
+        while True:
+            # окна по первичному ключу, а не OFFSET
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            scanned += len(batch)
+
+            wanted = {
+                (pk, tag): pub_date
+                for pk, text, pub_date in batch
+                for tag in extract_tags(text)
+            }
+            existing = {
+                (post_id, tag): pk
+                for pk, post_id, tag in PostTag.objects.filter(
+                    post_id__in=[pk for pk, _, _ in batch]
+                ).values_list('pk', 'post_id', 'tag')
+            }
+            stale = existing.keys() - wanted.keys()
+            new = wanted.keys() - existing.keys()
+            with transaction.atomic():
+                PostTag.objects.filter(
+                    pk__in=[existing[key] for key in stale]).delete()
+                PostTag.objects.bulk_create(
+                    [PostTag(post_id=pk, tag=tag, pub_date=wanted[pk, tag])
+                     for pk, tag in new],
+                    ignore_conflicts=True,
+                )
+            added += len(new)
+            removed += len(stale)
+            touched.update(tag for _, tag in stale | new)
+
+        # переиндексация правит только разошедшиеся теги, их ленты и сбросим
+        for tag in touched:
+            bump('tag', tag)
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {scanned}, тегов добавлено: {added}, '
+            f'удалено: {removed}'))
@@ -0,0 +1,107 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+# строк Inbox в одном INSERT-проходе заполнения
+FILL_BATCH = 10000
+
+
+def fill_inboxes(apps, schema_editor):
+    """Ленты для уже существующих подписок, как rebuild_inboxes:
+    последние INBOX_BACKFILL постов каждого автора, кроме «тяжелых»."""
+    Follow = apps.get_model('posts', 'Follow')
+    Inbox = apps.get_model('posts', 'Inbox')
+    Post = apps.get_model('posts', 'Post')
+    heavy = set(
+        Follow.objects.values('author')
+        .annotate(followers=Count('pk'))
+        .filter(followers__gte=settings.INBOX_FANOUT_LIMIT)
+        .values_list('author', flat=True)
+    )
+    follows = (
+        Follow.objects.exclude(author__in=heavy)
+        .order_by('author', 'user')
+        .values_list('user_id', 'author_id')
+    )
+    entries = []
+    current, posts = None, []
+    # по авторам: в памяти посты только одного из них
+    for user_id, author_id in follows.iterator():
+        if author_id != current:
+            current = author_id
+            posts = list(
+                Post.objects.filter(author_id=author_id)
+                .order_by('-pub_date', '-pk')
+                .values_list('pk', 'pub_date')[:settings.INBOX_BACKFILL]
+            )
+        entries.extend(
+            Inbox(user_id=user_id, post_id=pk, author_id=author_id,
+                  pub_date=pub_date)
+            for pk, pub_date in posts
+        )
+        if len(entries) >= FILL_BATCH:
+            Inbox.objects.bulk_create(entries)
+            entries = []
+    Inbox.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0001_SQUASHED_6sprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='posts.Post', verbose_name='Пост '),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follows'),
+        ),
+        migrations.AddField(
+            model_name='inbox',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AddField(
+            model_name='inbox',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='posts.Post', verbose_name='Пост'),
+        ),
+        migrations.AddField(
+            model_name='inbox',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to=settings.AUTH_USER_MODEL, verbose_name='Читатель'),
+        ),
+        migrations.AddIndex(
+            model_name='inbox',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='inbox_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inbox',
+            index=models.Index(fields=['user', 'author'], name='inbox_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inbox',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_inbox_post'),
+        ),
+        migrations.RunPython(fill_inboxes, migrations.RunPython.noop),
+    ]
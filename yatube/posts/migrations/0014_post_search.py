@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from posts.search import install_search
+    install_search(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from posts.search import uninstall_search
+    uninstall_search(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_media_blobs'),
+    ]
+
+    operations = [
+        # полнотекстовый индекс FTS5 по Post.text (posts/search.py)
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_tags(apps, schema_editor):
+    """Теги уже написанных постов, окнами по id."""
+    from posts.tags import extract_tags
+    Post = apps.get_model('posts', 'Post')
+    PostTag = apps.get_model('posts', 'PostTag')
+    posts = Post.objects.order_by('pk').values_list('pk', 'text', 'pub_date')
+    last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:1000])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        PostTag.objects.bulk_create(
+            PostTag(tag=tag, post_id=pk, pub_date=pub_date)
+            for pk, text, pub_date in batch
+            for tag in extract_tags(text)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100, verbose_name='Тег')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_entries', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Тег поста',
+                'verbose_name_plural': 'Теги постов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='posttag',
+            index=models.Index(fields=['tag', '-pub_date', '-post'], name='post_tag_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='posttag',
+            constraint=models.UniqueConstraint(fields=('post', 'tag'), name='unique_post_tag'),
+        ),
+        migrations.RunPython(fill_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Импорт')),
+                ('line', models.BigIntegerField(default=0, verbose_name='Строк записано')),
+                ('posts_from', models.BigIntegerField(blank=True, null=True)),
+                ('posts_to', models.BigIntegerField(blank=True, null=True)),
+                ('comments_from', models.BigIntegerField(blank=True, null=True)),
+                ('comments_to', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменен')),
+            ],
+            options={
+                'verbose_name': 'Позиция импорта',
+                'verbose_name_plural': 'Позиции импорта',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_heavy(apps, schema_editor):
+    """Флаг тем, кого прежний подсчет по Follow уже считал «тяжелыми»:
+    их посты не разложены по лентам. Строки счетчиков у них могло
+    не быть - заводим по таблицам, как posts.counters."""
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    UserStats = apps.get_model('posts', 'UserStats')
+    heavy = set(
+        Follow.objects.values('author')
+        .annotate(followers=Count('pk'))
+        .filter(followers__gte=settings.INBOX_FANOUT_LIMIT)
+        .values_list('author', flat=True)
+    )
+    for author_id in heavy:
+        UserStats.objects.get_or_create(user_id=author_id, defaults={
+            'posts_count': Post.objects.filter(author_id=author_id).count(),
+            'followers_count': Follow.objects.filter(
+                author_id=author_id).count(),
+            'following_count': Follow.objects.filter(
+                user_id=author_id).count(),
+        })
+    UserStats.objects.filter(user_id__in=heavy).update(heavy=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='heavy',
+            field=models.BooleanField(default=False, help_text='Ставится и снимается по followers_count (posts.feeds.author_followed, author_unfollowed)', verbose_name='Посты подмешиваются в ленты при чтении'),
+        ),
+        migrations.RunPython(mark_heavy, migrations.RunPython.noop),
+    ]
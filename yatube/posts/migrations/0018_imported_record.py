@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_userstats_heavy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10, verbose_name='Тип записи')),
+                ('source_id', models.BigIntegerField(verbose_name='id в выгрузке')),
+                ('target_id', models.BigIntegerField(verbose_name='id в базе')),
+            ],
+            options={
+                'verbose_name': 'Импортированная запись',
+                'verbose_name_plural': 'Импортированные записи',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='importedrecord',
+            constraint=models.UniqueConstraint(fields=('kind', 'source_id'), name='unique_imported_records'),
+        ),
+    ]
@@ -1,13 +1,40 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountersMixin:
+    """Счетчики меняются только атомарными F()-обновлениями.
+    Обычный save() уже существующей записи их не трогает, чтобы не
+    затереть значение, прочитанное до чужого обновления."""
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
+
+class Group(CountersMixin, models.Model):
     title = models.CharField(max_length=200, verbose_name="Название")
     slug = models.SlugField(unique=True)
     description = models.TextField(verbose_name="Описание")
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Постов в группе"
+    )
+
+    counter_fields = ('posts_count',)
 
     def __str__(self) -> str:
         return f'Группа {self.title}'
@@ -17,7 +44,7 @@ class Group(models.Model):
         verbose_name_plural = "Группы"
 
 
-class Post(models.Model):
+class Post(CountersMixin, models.Model):
     text = models.TextField(
         verbose_name="Текст поста",
         help_text='Напишите что-то важное')
@@ -25,6 +52,10 @@ class Post(models.Model):
         auto_now_add=True,
         verbose_name="Дата публикации"
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения"
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -43,8 +74,47 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # описание вариантов картинки для srcset, см. posts/variants.py
+    image_variants = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name="Варианты картинки"
+    )
+    # размеры, основной цвет и превью картинки: считаются один раз
+    # после загрузки, чтобы шаблоны не открывали файл
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Ширина картинки"
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Высота картинки"
+    )
+    image_color = models.CharField(
+        max_length=7,
+        blank=True,
+        editable=False,
+        verbose_name="Основной цвет картинки"
+    )
+    image_lqip = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name="Превью картинки"
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Комментариев"
+    )
+
+    counter_fields = ('comments_count',)
 
     def __str__(self):
         return self.text[:15]
@@ -53,6 +123,24 @@ class Post(models.Model):
         ordering = ('-pub_date',)
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
+        # ленты идут по (-pub_date, -id) с фильтром по автору или группе.
+        # id в индексе SQLite есть неявно (rowid) и всегда по возрастанию,
+        # поэтому индексы прямые: обратный проход дает нужный порядок
+        # без сортировки во временном B-дереве
+        indexes = [
+            models.Index(
+                fields=['pub_date'],
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', 'pub_date'],
+                name='post_group_pub_date_idx',
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -85,6 +173,12 @@ class Comment(models.Model):
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx',
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -109,9 +203,202 @@ class Follow(models.Model):
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
+        # (user, author) покрыт уникальным ограничением,
+        # обратный порядок нужен для выборок подписчиков автора
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name='unique_follows',
                 fields=['user', 'author'],
             ),
         ]
+
+
+class Inbox(models.Model):
+    """Лента подписок, разложенная по пользователям при публикации поста.
+    Дата поста и автор продублированы, чтобы лента читалась одним
+    проходом по индексу (user, -pub_date)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='inbox',
+        verbose_name="Читатель"
+    )
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='inbox_entries',
+        verbose_name="Пост"
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Автор"
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    def __str__(self) -> str:
+        return f'Пост {self.post_id} в ленте {self.user_id}'
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='inbox_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='inbox_user_author_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                name='unique_inbox_post',
+                fields=['user', 'post'],
+            ),
+        ]
+
+
+class PostTag(models.Model):
+    """Хэштег поста (posts/tags.py). Дата поста продублирована, чтобы
+    лента тега читалась одним проходом по индексу (tag, -pub_date)
+    без поиска по тексту постов."""
+    tag = models.CharField(max_length=100, verbose_name="Тег")
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='tag_entries',
+        verbose_name="Пост"
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    def __str__(self) -> str:
+        return f'#{self.tag} у поста {self.post_id}'
+
+    class Meta:
+        verbose_name = "Тег поста"
+        verbose_name_plural = "Теги постов"
+        indexes = [
+            models.Index(
+                fields=['tag', '-pub_date', '-post'],
+                name='post_tag_pub_date_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                name='unique_post_tag',
+                fields=['post', 'tag'],
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя. Строка заводится при первом чтении
+    (posts.counters.get_user_stats), дальше живет на F()-обновлениях."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name="Пользователь"
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name="Постов")
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name="Подписчиков")
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name="Подписок")
+    heavy = models.BooleanField(
+        default=False,
+        verbose_name="Посты подмешиваются в ленты при чтении",
+        help_text='Ставится и снимается по followers_count '
+                  '(posts.feeds.author_followed, author_unfollowed)'
+    )
+
+    def __str__(self) -> str:
+        return f'Счетчики {self.user_id}'
+
+    class Meta:
+        verbose_name = "Счетчики пользователя"
+        verbose_name_plural = "Счетчики пользователей"
+
+
+class MediaBlob(models.Model):
+    """Файл картинки в хранилище по содержимому (posts/storage.py)
+    и число постов, которые на него ссылаются. Файлы без ссылок
+    удаляет команда gc_blobs."""
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name="Файл"
+    )
+    refcount = models.PositiveIntegerField(
+        default=0, verbose_name="Ссылок")
+    # когда менялся счетчик: свежие файлы без ссылок сборщик не трогает
+    changed_at = models.DateTimeField(
+        auto_now=True, verbose_name="Изменен")
+
+    def __str__(self) -> str:
+        return self.name
+
+    class Meta:
+        verbose_name = "Файл картинки"
+        verbose_name_plural = "Файлы картинок"
+        indexes = [
+            models.Index(
+                fields=['refcount', 'changed_at'],
+                name='blob_refcount_changed_idx',
+            ),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """Позиция команды import_posts в потоке: сколько строк уже записано
+    и id записанных, но еще не обработанных постов и комментариев.
+    Обновляется в одной транзакции с пачкой, поэтому после сбоя импорт
+    продолжается с первой незаписанной строки."""
+    name = models.CharField(
+        max_length=200, unique=True, verbose_name="Импорт")
+    line = models.BigIntegerField(default=0, verbose_name="Строк записано")
+    posts_from = models.BigIntegerField(null=True, blank=True)
+    posts_to = models.BigIntegerField(null=True, blank=True)
+    comments_from = models.BigIntegerField(null=True, blank=True)
+    comments_to = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменен")
+
+    def __str__(self) -> str:
+        return f'Импорт {self.name}: {self.line} строк'
+
+    class Meta:
+        verbose_name = "Позиция импорта"
+        verbose_name_plural = "Позиции импорта"
+
+
+class ImportedRecord(models.Model):
+    """Пост или комментарий, заведенный import_posts из записи выгрузки
+    (команда export) с id source_id. По нему комментарии выгрузки
+    находят свои посты, а записи, выгруженные повторно, пропускаются."""
+    kind = models.CharField(max_length=10, verbose_name="Тип записи")
+    source_id = models.BigIntegerField(verbose_name="id в выгрузке")
+    target_id = models.BigIntegerField(verbose_name="id в базе")
+
+    def __str__(self) -> str:
+        return f'{self.kind} {self.source_id} -> {self.target_id}'
+
+    class Meta:
+        verbose_name = "Импортированная запись"
+        verbose_name_plural = "Импортированные записи"
+        constraints = [
+            models.UniqueConstraint(
+                name='unique_imported_records',
+                fields=['kind', 'source_id'],
+            ),
+        ]
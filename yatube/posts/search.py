@@ -0,0 +1,205 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .utils import BACKWARD, KeysetPaginator, decode_cursor, encode_cursor
+
+FTS_TABLE = 'posts_post_fts'
+WORD = re.compile(r'\w+')
+# границы совпадений в snippet(): текст поста экранируется уже после
+MARK_START, MARK_END = '\x02', '\x03'
+# сортировка выдачи: колонка ключа, идет ли она по убыванию и как
+# разобрать ключ из курсора
+ORDERS = {
+    # bm25: чем меньше rank, тем лучше совпадение
+    'rank': ('rank', False, float),
+    # по дате поста, как в лентах, а не по rowid: у постов из seed
+    # и import_posts id идут не в порядке дат. Дата берется соединением
+    # с posts_post по первичному ключу
+    'new': ('"posts_post"."pub_date"', True, parse_datetime),
+}
+
+# Внешний контент: индекс хранит только термы, текст берется из posts_post.
+# Триггеры держат индекс в согласии с таблицей при любой записи,
+# включая bulk_create и queryset.update()
+TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE "{FTS_TABLE}" USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+"""
+TRIGGERS_SQL = {
+    f'{FTS_TABLE}_insert': f"""
+        CREATE TRIGGER "{FTS_TABLE}_insert" AFTER INSERT ON "posts_post"
+        BEGIN
+            INSERT INTO "{FTS_TABLE}" (rowid, text)
+            VALUES (new.id, new.text);
+        END
+    """,
+    f'{FTS_TABLE}_delete': f"""
+        CREATE TRIGGER "{FTS_TABLE}_delete" AFTER DELETE ON "posts_post"
+        BEGIN
+            INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}", rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END
+    """,
+    # post.save() пишет все колонки: индекс трогаем, только если
+    # текст действительно изменился
+    f'{FTS_TABLE}_update': f"""
+        CREATE TRIGGER "{FTS_TABLE}_update"
+        AFTER UPDATE OF text ON "posts_post"
+        WHEN old.text IS NOT new.text
+        BEGIN
+            INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}", rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO "{FTS_TABLE}" (rowid, text)
+            VALUES (new.id, new.text);
+        END
+    """,
+}
+
+
+def install_search(connection, create=True):
+    """Создает индекс и триггеры, которых нет; новый индекс заполняется
+    из posts_post. SQLite теряет триггеры, когда миграция пересоздает
+    таблицу posts_post, поэтому после каждого migrate они
+    восстанавливаются (create=False: только для уже созданного индекса)."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [FTS_TABLE, *TRIGGERS_SQL])
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            if not create:
+                return
+            cursor.execute(TABLE_SQL)
+            cursor.execute(
+                f'INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}") '
+                f"VALUES ('rebuild')")
+        for name, sql in TRIGGERS_SQL.items():
+            if name not in existing:
+                cursor.execute(sql)
+
+
+def uninstall_search(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS_SQL:
+            cursor.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+        cursor.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение FTS5 MATCH: все слова
+    обязательны, последнее ищется по префиксу. Слова берутся в кавычки,
+    так что синтаксис FTS5 из запроса не проходит."""
+    words = WORD.findall(query.lower())[:settings.SEARCH_MAX_WORDS]
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    if len(words[-1]) > 1:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids_sql(expression):
+    """Подзапрос с id постов, где есть все слова выражения."""
+    return (
+        f'SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s',
+        [expression],
+    )
+
+
+def render_snippet(raw):
+    """Отрывок из snippet() как безопасный HTML с <mark>."""
+    return mark_safe(
+        escape(raw).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    )
+
+
+class SearchPaginator(KeysetPaginator):
+    """Листает найденные посты по ключу (rank, id) или (дата, id).
+    Страница - это один запрос к индексу с LIMIT и один in_bulk
+    за самими постами."""
+
+    def __init__(self, expression, order, per_page):
+        super().__init__(Post.objects.none(), per_page)
+        self.expression = expression
+        self.key, self.descending, self.parse = ORDERS[order]
+        self.by_date = self.key != 'rank'
+
+    def get_cursor_page(self, cursor):
+        direction, position = decode_cursor(cursor, parse=self.parse)
+        rows = self.fetch(direction, position)
+        return self.build_page(rows, direction, position)
+
+    def fetch(self, direction, position):
+        if (direction == BACKWARD) != self.descending:
+            lookup, sort = '<', 'DESC'
+        else:
+            lookup, sort = '>', 'ASC'
+        params = [
+            MARK_START, MARK_END, '…', settings.SEARCH_SNIPPET_TOKENS,
+            self.expression,
+        ]
+        rowid = f'"{FTS_TABLE}".rowid'
+        join = seek = ''
+        if self.by_date:
+            join = f'JOIN "posts_post" ON "posts_post"."id" = {rowid}'
+        if position is not None:
+            value, pk = position
+            if self.by_date:
+                # в том же виде, в каком Django пишет даты в SQLite
+                value = connection.ops.adapt_datetimefield_value(value)
+            seek = (f'AND ({self.key} {lookup} %s '
+                    f'OR ({self.key} = %s AND {rowid} {lookup} %s))')
+            params += [value, value, pk]
+        params.append(self.per_page + 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {rowid}, {self.key}, '
+                f'snippet("{FTS_TABLE}", 0, %s, %s, %s, %s) '
+                f'FROM "{FTS_TABLE}" {join} '
+                f'WHERE "{FTS_TABLE}" MATCH %s {seek} '
+                f'ORDER BY {self.key} {sort}, {rowid} {sort} LIMIT %s',
+                params,
+            )
+            rows = cursor.fetchall()
+
+        posts = (
+            Post.objects.select_related('author', 'group')
+            .order_by().in_bulk([pk for pk, _, _ in rows])
+        )
+        result = []
+        for pk, key, snippet in rows:
+            if pk in posts:
+                post = posts[pk]
+                # дату для курсора - из модели, с часовым поясом
+                post.search_key = post.pub_date if self.by_date else key
+                post.snippet = render_snippet(snippet)
+                result.append(post)
+        return result
+
+    def cursor_for(self, direction, row):
+        return encode_cursor(direction, row.search_key, row.pk)
+
+
+def get_search_page(request, query, order):
+    """Страница результатов поиска или None для пустого запроса."""
+    expression = match_expression(query)
+    if not expression:
+        return None
+    paginator = SearchPaginator(expression, order, settings.NUMBER_OF_POSTS)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
@@ -0,0 +1,123 @@
+from django.db.models.signals import (
+    post_delete, post_save, pre_save
+)
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import caching, counters, feeds, tags
+from .models import Comment, Follow, Group, Post, User
+
+# автор и группа в карточке поста (includes/article.html): поколение
+# их карточек, поле поста и поля, которые в карточке видны
+CARD_SOURCES = {
+    User: ('author-card', 'author', ('username', 'first_name', 'last_name')),
+    Group: ('group-card', 'group', ('slug', 'title')),
+}
+
+
+@receiver(pre_save, sender=Post)
+def post_pre_save(sender, instance, raw=False, **kwargs):
+    """Запоминаем прежние группу, картинку и текст: ленту группы тоже
+    надо сбросить, у картинки убавить число ссылок, а теги разобрать
+    заново, только если текст поменялся."""
+    instance._old_group_id = instance._old_image = None
+    instance._old_text = None
+    if instance.pk and not raw:
+        instance._old_group_id, instance._old_image, instance._old_text = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image', 'text').first()
+            or (None, None, None)
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    """Новый пост попадает в ленту автора и в ленты подписчиков."""
+    if raw:
+        return
+    old_group_id = getattr(instance, '_old_group_id', None)
+    removed_tags = ()
+    if created or getattr(instance, '_old_text', None) != instance.text:
+        removed_tags = tags.sync_post_tags(instance, created)
+    caching.bump_post_feeds(instance, old_group_id, removed_tags)
+    if created:
+        counters.post_created(instance)
+        feeds.timeline_add(instance)
+        feeds.fan_out_post(instance)
+    else:
+        counters.post_moved(old_group_id, instance.group_id)
+        counters.post_image_changed(
+            getattr(instance, '_old_image', None), instance.image.name)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    caching.bump_post_feeds(instance)
+    counters.post_deleted(instance)
+    feeds.timeline_remove(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if instance.post_id and not raw:
+        if created:
+            counters.change_post(instance.post_id, 1)
+        caching.bump_post_feeds(instance.post)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+    if instance.post_id:
+        caching.bump_post_feeds_by_id(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    """При подписке заполняем ленту свежими постами автора."""
+    if created and not raw:
+        counters.follow_changed(instance, 1)
+        feeds.author_followed(instance.author_id)
+        feeds.backfill_inbox(instance.user_id, instance.author_id)
+        caching.bump('follow', instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """При отписке чистим ленту от постов автора."""
+    counters.follow_changed(instance, -1)
+    feeds.prune_inbox(instance.user_id, instance.author_id)
+    # после фиксации: если удаляют самого автора, раскладывать нечего
+    author_id = instance.author_id
+    transaction.on_commit(lambda: feeds.author_unfollowed(author_id))
+    caching.bump('follow', instance.user_id)
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Group)
+def card_source_pre_save(sender, instance, raw=False, update_fields=None,
+                         **kwargs):
+    """Запоминаем, как автор или группа выглядели в карточках.
+    Сохранения с update_fields без этих полей (last_login при входе)
+    не проверяем."""
+    _, _, fields = CARD_SOURCES[sender]
+    instance._old_card = None
+    if raw or not instance.pk:
+        return
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return
+    instance._old_card = (
+        sender.objects.filter(pk=instance.pk).values_list(*fields).first())
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def card_source_saved(sender, instance, raw=False, **kwargs):
+    """Новое имя автора или slug группы: карточки их постов получают
+    новые ключи, а страницы лент с этими карточками сбрасываются."""
+    scope, field, fields = CARD_SOURCES[sender]
+    old = getattr(instance, '_old_card', None)
+    if old is None or old == tuple(getattr(instance, name) for name in fields):
+        return
+    caching.bump(scope, instance.pk)
+    caching.bump_posts_feeds(Post.objects.filter(**{field: instance}))
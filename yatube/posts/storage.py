@@ -0,0 +1,53 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла - sha256 его содержимого.
+
+    posts/cat.jpg сохраняется как posts/ab/cd/abcd...ef.jpg: два уровня
+    каталогов по префиксу хэша держат каталоги небольшими, а одинаковые
+    загрузки ложатся в один файл. Сколько постов на него ссылается,
+    считает MediaBlob, удаляет ненужные файлы команда gc_blobs.
+    """
+
+    def content_name(self, name, content):
+        sha = hashlib.sha256()
+        # chunks() читает файл с начала, по кускам
+        for chunk in content.chunks():
+            sha.update(chunk)
+        digest = sha.hexdigest()
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # занятое имя значит, что такой же файл уже лежит в хранилище
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        try:
+            if self.exists(name):
+                raise FileExistsError(name)
+            return self._save(name, content)
+        except OSError:
+            if not self.exists(name):
+                raise
+        # файл снова нужен: свежее время изменения не даст gc_blobs
+        # удалить его, пока ссылка на него еще не записана в базу
+        os.utime(self.path(name))
+        return name
@@ -0,0 +1,52 @@
+import re
+
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import PostTag
+
+TAG_MAX_LENGTH = PostTag._meta.get_field('tag').max_length
+# #слово, где есть хотя бы одна буква; &#123; и середина слова не теги
+TAG = re.compile(r'(?<![\w&#])#(\w*[^\W\d_]\w*)')
+
+
+def extract_tags(text):
+    """Хэштеги текста в нижнем регистре, без повторов."""
+    return {
+        tag.lower() for tag in TAG.findall(text or '')
+        if len(tag) <= TAG_MAX_LENGTH
+    }
+
+
+def sync_post_tags(post, created=False):
+    """Приводит записи PostTag поста к хэштегам его текста.
+    Возвращает теги, которые у поста пропали."""
+    tags = extract_tags(post.text)
+    old = set() if created else set(
+        PostTag.objects.filter(post=post).values_list('tag', flat=True))
+    removed = old - tags
+    if removed:
+        PostTag.objects.filter(post=post, tag__in=removed).delete()
+    PostTag.objects.bulk_create(
+        [PostTag(tag=tag, post_id=post.pk, pub_date=post.pub_date)
+         for tag in tags - old],
+        ignore_conflicts=True,
+    )
+    return removed
+
+
+def link_tags(text):
+    """Текст поста как HTML, где хэштеги - ссылки на их ленты."""
+    parts = []
+    start = 0
+    for match in TAG.finditer(text):
+        tag = match.group(1)
+        if len(tag) > TAG_MAX_LENGTH:
+            continue
+        parts.append(escape(text[start:match.start()]))
+        url = reverse('posts:tag_posts', args=[tag.lower()])
+        parts.append(f'<a href="{escape(url)}">#{escape(tag)}</a>')
+        start = match.end()
+    parts.append(escape(text[start:]))
+    return mark_safe(''.join(parts))
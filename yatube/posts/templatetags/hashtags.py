@@ -0,0 +1,11 @@
+from django import template
+
+from posts.tags import link_tags as make_links
+
+register = template.Library()
+
+
+@register.filter
+def link_tags(text):
+    """Текст поста со ссылками на ленты его хэштегов."""
+    return make_links(text)
@@ -0,0 +1,59 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.caching import get_generations
+from posts.thumbnails import prefetch_thumbnails, thumbnails_ready
+
+register = template.Library()
+
+
+def card_scopes(post):
+    # имя автора и slug группы видны в карточке
+    scopes = [('author-card', post.author_id)]
+    if post.group_id is not None:
+        scopes.append(('group-card', post.group_id))
+    return scopes
+
+
+def card_keys(posts):
+    """Ключи карточек меняются при каждой правке поста (updated_at)
+    и при правке его автора или группы (поколения author-card
+    и group-card, одним get_many на страницу)."""
+    scopes = list(dict.fromkeys(
+        scope for post in posts for scope in card_scopes(post)))
+    versions = dict(zip(scopes, get_generations(scopes)))
+    return [
+        f'post-card:{post.pk}:{post.updated_at.timestamp()}:'
+        + ':'.join(str(versions[scope]) for scope in card_scopes(post))
+        for post in posts
+    ]
+
+
+def card_key(post):
+    return card_keys([post])[0]
+
+
+@register.simple_tag
+def post_cards(posts):
+    """HTML карточек страницы ленты (includes/article.html).
+    Все карточки читаются из кэша одним get_many, промахи рендерятся
+    и кладутся обратно одним set_many."""
+    keys = card_keys(posts)
+    cards = cache.get_many(keys)
+    prefetch_thumbnails(
+        post.image for key, post in zip(keys, posts) if key not in cards)
+    missed = {}
+    for key, post in zip(keys, posts):
+        if key in cards:
+            continue
+        cards[key] = render_to_string(
+            'includes/article.html', {'post': post})
+        # карточку с заглушкой вместо картинки не кэшируем
+        if not post.image or thumbnails_ready(post.image):
+            missed[key] = cards[key]
+    if missed:
+        cache.set_many(missed, settings.POST_CARD_CACHE_TIMEOUT)
+    return [mark_safe(cards[key]) for key in keys]
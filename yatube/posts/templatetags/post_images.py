@@ -0,0 +1,31 @@
+from django import template
+from django.conf import settings
+
+from posts.thumbnails import get_ready_thumbnail, queue_thumbnails
+from posts.variants import image_sources as get_image_sources
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnail(image, preset):
+    """Миниатюра размера preset (settings.POST_THUMBNAILS), если она уже
+    построена, иначе None. В отличие от {% thumbnail %} не генерирует ее
+    посреди запроса, а ставит в фоновую очередь. Без пула потоков
+    не строит вовсе: миниатюры тогда строятся при загрузке
+    и командой make_thumbnails."""
+    if not image:
+        return None
+    thumbnail = get_ready_thumbnail(image, preset)
+    if thumbnail is None:
+        queue_thumbnails(image.name, inline=False)
+    return thumbnail
+
+
+@register.simple_tag
+def image_sources(post):
+    """<source> для <picture>: [(type, srcset, sizes), ...]."""
+    return [
+        (content_type, srcset, settings.POST_IMAGE_SIZES)
+        for content_type, srcset in get_image_sources(post)
+    ]
@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='api_author')
+        self.group = Group.objects.create(
+            title='Группа', slug='api', description='Описание')
+        self.posts = [
+            Post.objects.create(
+                author=self.author, group=self.group, text=f'Пост {number}')
+            for number in range(3)
+        ]
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(f'posts:{name}', args=args), params)
+
+    def test_feeds_with_cursor_and_fields(self):
+        """Ленты листаются курсором, ?fields= выбирает поля."""
+        first = self.get('api_index', limit=2, fields='id,author').json()
+        self.assertEqual(
+            first['results'],
+            [{'id': self.posts[2].pk, 'author': 'api_author'},
+             {'id': self.posts[1].pk, 'author': 'api_author'}])
+        second = self.get('api_index', limit=2,
+                          cursor=first['next_cursor']).json()
+        self.assertEqual([row['id'] for row in second['results']],
+                         [self.posts[0].pk])
+        self.assertIsNone(second['next_cursor'])
+
+        group = self.get('api_group_posts', 'api').json()
+        self.assertEqual(group['group']['posts_count'], 3)
+        self.assertEqual(group['results'][0]['group'], 'api')
+        profile = self.get('api_profile', 'api_author').json()
+        self.assertEqual(profile['author']['posts_count'], 3)
+        self.assertEqual(len(profile['results']), 3)
+
+        self.assertEqual(self.get('api_index', fields='secret').status_code,
+                         400)
+        self.assertEqual(self.get('api_profile', 'nobody').status_code, 404)
+
+    def test_post_detail_etag(self):
+        """Повтор с If-None-Match - 304 без чтения поста, новый
+        комментарий меняет ETag."""
+        post = self.posts[0]
+        response = self.get('api_post_detail', post.pk)
+        self.assertEqual(response.json()['post']['text'], 'Пост 0')
+        etag = response['ETag']
+
+        url = reverse('posts:api_post_detail', args=[post.pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(author=self.author, post=post, text='Ну')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [comment['text'] for comment in
+             response.json()['comments']['results']], ['Ну'])
+
+    def test_profile_etag_follows_counters(self):
+        """Новая подписка меняет ETag профиля: в ответе ее счетчики."""
+        url = reverse('posts:api_profile', args=['api_author'])
+        etag = self.client.get(url)['ETag']
+        reader = User.objects.create_user(username='api_reader')
+        Follow.objects.create(user=reader, author=self.author)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['author']['followers_count'], 1)
@@ -0,0 +1,77 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts.counters import get_user_stats
+from posts.models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='counted_author')
+        self.reader = User.objects.create_user(username='counted_reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='counted', description='Описание')
+
+    def test_counters_follow_writes(self):
+        """Счетчики меняются вместе с постами, комментариями и подписками."""
+        get_user_stats(self.author)
+        get_user_stats(self.reader)
+
+        post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост')
+        Comment.objects.create(author=self.reader, post=post, text='Ну')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+
+        post.delete()
+        Follow.objects.all().delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        author_stats.refresh_from_db()
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+
+    def test_save_does_not_overwrite_counter(self):
+        """Сохранение устаревшего экземпляра не затирает счетчик."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        stale = Post.objects.get(pk=post.pk)
+        Comment.objects.create(author=self.reader, post=post, text='Ну')
+
+        stale.text = 'Правка'
+        stale.save()
+
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Правка')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_recount_repairs_drift(self):
+        post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост')
+        get_user_stats(self.author)
+        Post.objects.update(comments_count=7)
+        Group.objects.update(posts_count=0)
+        UserStats.objects.update(posts_count=5)
+
+        call_command('recount', chunk_size=1, stdout=StringIO())
+
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
@@ -0,0 +1,68 @@
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='exported_author')
+        self.reader = User.objects.create_user(username='exported_reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='exported', description='Описание')
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост')
+        Comment.objects.create(
+            author=self.reader, post=self.post, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        handle, self.path = tempfile.mkstemp(suffix='.ndjson.gz')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def export(self, *args):
+        call_command('export', self.path, '--window-size', '1', *args,
+                     stderr=StringIO())
+        with gzip.open(self.path, 'rt', encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_full_export(self):
+        """Все типы записей, ссылки именами, файл сжат по расширению."""
+        Post.objects.create(author=self.reader, text='Второй')
+        records = self.export()
+
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['group', 'post', 'post', 'comment', 'follow'])
+        post = records[1]
+        self.assertEqual(post['id'], self.post.pk)
+        self.assertEqual(post['author'], 'exported_author')
+        self.assertEqual(post['group'], 'exported')
+        self.assertEqual(post['pub_date'], self.post.pub_date.isoformat())
+        self.assertEqual(records[3]['post'], self.post.pk)
+        self.assertEqual(records[4]['user'], 'exported_reader')
+
+    def test_incremental_export(self):
+        """С --since выгружается только новое, группы и подписки -
+        целиком."""
+        since = timezone.now()
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        records = self.export('--since', since.isoformat())
+
+        self.assertEqual(
+            [(record['type'], record['id']) for record in records
+             if record['type'] in ('post', 'comment')],
+            [('post', new_post.pk)])
+        self.assertEqual(
+            {record['type'] for record in records},
+            {'group', 'post', 'follow'})
@@ -0,0 +1,165 @@
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.feeds import TimelinePaginator, get_timeline, heavy_author_ids
+from posts.models import Follow, Inbox, Post
+
+User = get_user_model()
+
+
+class InboxTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='inbox_author')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def follow_page_ids(self):
+        response = self.client.get(reverse('posts:follow_index'))
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_inbox_filled_on_follow_and_post(self):
+        """Подписка заполняет ленту, новый пост раскладывается по ней,
+        отписка ленту чистит."""
+        old_post = Post.objects.create(author=self.author, text='До')
+        self.client.get(
+            reverse('posts:profile_follow', args=[self.author.username]))
+        new_post = Post.objects.create(author=self.author, text='После')
+
+        self.assertEqual(
+            Inbox.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(self.follow_page_ids(), [new_post.pk, old_post.pk])
+
+        self.client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username]))
+        self.assertFalse(Inbox.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.follow_page_ids(), [])
+
+    @override_settings(INBOX_FANOUT_LIMIT=1)
+    def test_heavy_author_merged_on_read(self):
+        """Посты популярного автора не раскладываются, а подмешиваются."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Для всех')
+
+        self.assertFalse(Inbox.objects.exists())
+        self.assertEqual(self.follow_page_ids(), [post.pk])
+
+    @override_settings(INBOX_FANOUT_LIMIT=2, INBOX_FANOUT_RELEASE=2)
+    def test_author_below_limit_is_fanned_out_again(self):
+        """Флаг «тяжелого» автора ведется по счетчику подписчиков,
+        а когда их стало меньше порога, его посты раскладываются."""
+        other = User.objects.create_user(username='other_reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(author=self.author, text='Для всех')
+        self.assertEqual(heavy_author_ids([self.author.pk]),
+                         {self.author.pk})
+        self.assertFalse(Inbox.objects.exists())
+
+        with mock.patch('django.db.transaction.on_commit',
+                        lambda callback: callback()):
+            Follow.objects.filter(user=other).delete()
+
+        self.assertEqual(heavy_author_ids([self.author.pk]), set())
+        self.assertEqual(
+            list(Inbox.objects.values_list('user', 'post')),
+            [(self.reader.pk, post.pk)])
+        self.assertEqual(self.follow_page_ids(), [post.pk])
+
+    def test_rebuild_inboxes(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Текст')
+        Inbox.objects.all().delete()
+
+        call_command('rebuild_inboxes', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            list(Inbox.objects.values_list('user', 'post')),
+            [(self.reader.pk, post.pk)])
+
+
+class TimelineTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='timeline_author')
+
+    def setUp(self):
+        cache.clear()
+
+    def profile_pages(self):
+        """Проходит профиль курсорами и возвращает id постов по страницам."""
+        url = reverse('posts:profile', args=[self.author.username])
+        pages = []
+        cursor = None
+        while True:
+            response = self.client.get(url, {'cursor': cursor or ''})
+            page = response.context['page_obj']
+            pages.append([post.pk for post in page])
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    @override_settings(TIMELINE_SIZE=5)
+    def test_profile_pages_beyond_cached_window(self):
+        posts = [Post.objects.create(author=self.author, text=str(i))
+                 for i in range(13)]
+        expected = [post.pk for post in reversed(posts)]
+
+        pages = self.profile_pages()
+
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(len(pages[0]), settings.NUMBER_OF_POSTS)
+
+    @override_settings(TIMELINE_SIZE=5)
+    def test_profile_previous_page_beyond_cached_window(self):
+        """Назад со страницы за окном кэша - без пропусков."""
+        posts = [Post.objects.create(author=self.author, text=str(i))
+                 for i in range(13)]
+        url = reverse('posts:profile', args=[self.author.username])
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        previous = self.client.get(
+            url, {'cursor': second.previous_cursor}).context['page_obj']
+
+        self.assertEqual([post.pk for post in previous],
+                         [post.pk for post in reversed(posts[3:])])
+
+    def test_timeline_follows_signals(self):
+        first = Post.objects.create(author=self.author, text='Первый')
+        self.assertEqual([pk for _, pk in get_timeline(self.author.pk)],
+                         [first.pk])
+
+        second = Post.objects.create(author=self.author, text='Второй')
+        self.assertEqual([pk for _, pk in get_timeline(self.author.pk)],
+                         [first.pk, second.pk])
+
+        first.delete()
+        self.assertEqual([pk for _, pk in get_timeline(self.author.pk)],
+                         [second.pk])
+
+    def test_profile_page_reads_only_shown_posts(self):
+        for i in range(3):
+            Post.objects.create(author=self.author, text=str(i))
+        get_timeline(self.author.pk)
+        paginator = TimelinePaginator([self.author.pk], 2)
+
+        with self.assertNumQueries(1):
+            page = paginator.get_cursor_page(None)
+        self.assertEqual(len(page), 2)
+        self.assertTrue(page.has_next())
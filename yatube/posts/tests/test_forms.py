@@ -1,5 +1,8 @@
 import shutil
+import struct
 import tempfile
+import zlib
+from io import StringIO
 from django.contrib.auth import get_user_model
 from posts.models import Post, Group, Follow
 from django.test import Client, TestCase
@@ -9,10 +12,25 @@ from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.core.cache import caches
+from sorl.thumbnail import default
+from django.core.management import call_command
+from unittest import mock
+from posts.thumbnails import (
+    generate_thumbnails, submit_thumbnails, thumbnails_failed,
+    thumbnails_ready
+)
 
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -39,6 +57,8 @@ class TaskCreateFormTests(TestCase):
         self.authorized_client.force_login(self.user)
         cache = caches['default']
         cache.clear()
+        # LRU записей sorl живет в процессе дольше тестовой транзакции
+        default.kvstore.local.clear()
 
     def test_create_post(self):
         """Валидная форма создает запись."""
@@ -82,7 +102,110 @@ class TaskCreateFormTests(TestCase):
         self.assertEqual(post_after.text, 'Тестовый текст формы')
         self.assertEqual(post_after.author, self.user)
         self.assertEqual(post_after.group, self.test_group)
-        self.assertEqual(post_after.image, 'posts/small.gif')
+        # файл назван по sha256 содержимого и разложен по каталогам
+        self.assertRegex(
+            post_after.image.name,
+            r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$')
+        # размеры берутся из заголовка еще при загрузке
+        self.assertEqual(
+            (post_after.image_width, post_after.image_height), (2, 1))
+
+    def test_thumbnails_generated_after_upload(self):
+        """Пока миниатюра не построена, вместо картинки заглушка."""
+        post = Post.objects.create(
+            text='С картинкой',
+            author=self.user,
+            image=SimpleUploadedFile('thumb.gif', SMALL_GIF, 'image/gif'),
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertFalse(thumbnails_ready(post.image))
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'image-placeholder')
+
+        generate_thumbnails(post.image.name)
+
+        self.assertTrue(thumbnails_ready(post.image))
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, 'image-placeholder')
+        self.assertContains(response, '<img')
+        # варианты для srcset построены по этой картинке
+        self.assertContains(response, 'srcset=')
+        post.refresh_from_db()
+        self.assertIn(f'"source": "{post.image.name}"', post.image_variants)
+        self.assertEqual(post.image_color, '#000000')
+        self.assertTrue(post.image_lqip.startswith('data:image/png;base64,'))
+
+    def test_broken_image_not_requeued(self):
+        """Неудача запоминается, и картинка больше не ставится в очередь;
+        шаблон без пула потоков миниатюр не строит."""
+        post = Post.objects.create(
+            text='С битой картинкой',
+            author=self.user,
+            image=SimpleUploadedFile('broken.gif', b'GIF89a', 'image/gif'),
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        with mock.patch('posts.thumbnails.generate_thumbnails') as generate, \
+                mock.patch('django.db.transaction.on_commit',
+                           lambda callback: callback()):
+            self.assertContains(
+                self.authorized_client.get(url), 'image-placeholder')
+        generate.assert_not_called()
+
+        with self.assertLogs(level='WARNING'):
+            generate_thumbnails(post.image.name)
+        self.assertTrue(thumbnails_failed(post.image.name))
+        with mock.patch('posts.thumbnails.generate_thumbnails') as generate:
+            submit_thumbnails(post.image.name)
+        generate.assert_not_called()
+
+    def test_fill_image_info(self):
+        """Команда дозаполняет размеры, цвет и превью старых постов."""
+        post = Post.objects.create(
+            text='Старый пост',
+            author=self.user,
+            image=SimpleUploadedFile('old.gif', SMALL_GIF, 'image/gif'),
+        )
+        self.assertIsNone(post.image_width)
+
+        call_command('fill_image_info', workers=1, stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(post.image_color, '#000000')
+        self.assertTrue(post.image_lqip)
+
+    def post_image(self, content, name='upload.png'):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'С картинкой',
+                'image': SimpleUploadedFile(name, content, 'image/png'),
+            },
+        )
+
+    def test_decompression_bomb_rejected_by_header(self):
+        """Картинку с огромными размерами в заголовке отбрасываем,
+        не распаковывая."""
+        ihdr = struct.pack('>IIBBBBB', 50000, 50000, 8, 2, 0, 0, 0)
+        bomb = (
+            b'\x89PNG\r\n\x1a\n'
+            + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr
+            + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+            + struct.pack('>I', 1024) + b'IDAT' + b'\x00' * 1024
+        )
+        response = self.post_image(bomb)
+
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertIn('Слишком большая картинка',
+                      response.context['form'].errors['image'][0])
+
+    @override_settings(UPLOAD_IMAGE_MAX_BYTES=16)
+    def test_too_large_upload_rejected(self):
+        response = self.post_image(b'\x89PNG' + b'\x00' * 64)
+
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertIn('Файл больше',
+                      response.context['form'].errors['image'][0])
 
     def test_post_edit(self):
         """Валидная форма редактирует запись."""
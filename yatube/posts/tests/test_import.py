@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from posts.models import (Comment, Follow, Group, ImportCheckpoint, Inbox,
+                          Post, PostTag)
+
+User = get_user_model()
+
+
+class ImportPostsTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='imported_author')
+        self.reader = User.objects.create_user(username='imported_reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='imported', description='Описание')
+        Follow.objects.create(user=self.reader, author=self.author)
+        handle, self.path = tempfile.mkstemp(suffix='.ndjson')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def write_lines(self, *records):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            for record in records:
+                line = record if isinstance(record, str) else json.dumps(
+                    record, ensure_ascii=False)
+                file.write(line + '\n')
+
+    def run_import(self, *args):
+        call_command('import_posts', self.path, *args,
+                     stdout=StringIO(), stderr=StringIO())
+
+    def test_import_with_side_effects(self):
+        """Посты, комментарии, теги, счетчики и ленты подписок, как
+        при создании через save(); неверные строки пропускаются."""
+        self.write_lines(
+            {'author': 'imported_author', 'group': 'imported',
+             'text': 'Первый #импорт', 'pub_date': '2020-01-31T12:00:00Z',
+             'comments': [{'author': 'imported_reader', 'text': 'Ну'}]},
+            'не json',
+            {'author': 'nobody', 'text': 'Чужой'},
+            {'author': 'imported_author', 'text': 'Второй'},
+        )
+        self.run_import('--batch-size', '1')
+        first = Post.objects.get(text='Первый #импорт')
+        self.write_lines({'type': 'comment', 'post': first.pk,
+                          'author': 'imported_author', 'text': 'Ответ'})
+        self.run_import('--checkpoint', 'comments')
+
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(
+            first.pub_date, datetime(2020, 1, 31, 12, tzinfo=timezone.utc))
+        first.refresh_from_db()
+        self.assertEqual(first.comments_count, 2)
+        self.assertEqual(Comment.objects.filter(post=first).count(), 2)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertTrue(PostTag.objects.filter(
+            post=first, tag='импорт').exists())
+        self.assertEqual(
+            Inbox.objects.filter(user=self.reader).count(), 2)
+        self.assertFalse(ImportCheckpoint.objects.filter(
+            posts_from__isnull=False).exists())
+
+    def test_resume_after_errors(self):
+        """После остановки повторный запуск продолжает с первой
+        незаписанной строки, без дублей."""
+        good = {'author': 'imported_author', 'text': 'Пост'}
+        self.write_lines(good, good, {'author': 'nobody', 'text': 'x'}, good)
+        with self.assertRaises(CommandError):
+            self.run_import('--batch-size', '1', '--max-errors', '0')
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get().line, 2)
+
+        self.write_lines(good, good, good, good)
+        self.run_import('--batch-size', '1')
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertEqual(ImportCheckpoint.objects.get().line, 4)
+
+    def test_import_export_output(self):
+        """Вывод export загружается: группы и подписки заводятся,
+        комментарии попадают к своим постам по id выгрузки, повторный
+        импорт ничего не дублирует."""
+        extra = Group.objects.create(
+            title='Выгружена', slug='exported', description='')
+        post = Post.objects.create(
+            author=self.author, group=extra, text='Выгружен')
+        Comment.objects.create(author=self.reader, post=post, text='Ответ')
+        call_command('export', self.path, stderr=StringIO())
+        Post.objects.filter(pk=post.pk).update(group=None)
+        extra.delete()
+        Follow.objects.all().delete()
+
+        self.run_import()
+        copy = Post.objects.exclude(pk=post.pk).get(text='Выгружен')
+        self.assertEqual(copy.group.slug, 'exported')
+        self.assertEqual(
+            list(copy.comments.values_list('text', flat=True)), ['Ответ'])
+        self.assertEqual(post.comments.count(), 1)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author).exists())
+
+        self.run_import('--restart')
+        self.assertEqual(Post.objects.filter(text='Выгружен').count(), 2)
+        self.assertEqual(Comment.objects.count(), 2)
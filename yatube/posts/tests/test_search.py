@@ -0,0 +1,98 @@
+from datetime import datetime, timezone
+
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.admin import PostAdmin
+from posts.models import Post
+from posts.search import match_expression
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher')
+
+    def search(self, **params):
+        response = self.client.get(reverse('posts:search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_match_expression_quotes_words(self):
+        self.assertEqual(
+            match_expression('Кошки AND "собаки" -NEAR('),
+            '"кошки" "and" "собаки" "near"*')
+        self.assertEqual(match_expression('() "'), '')
+
+    def test_results_ranked_with_highlighted_snippet(self):
+        Post.objects.create(author=self.user, text='Про кошку и собаку')
+        best = Post.objects.create(
+            author=self.user, text='Кошка, кошка <b>кошка</b>')
+        Post.objects.create(author=self.user, text='Только собака')
+
+        page = self.search(q='кошк')
+
+        self.assertEqual(len(page), 2)
+        self.assertEqual(page[0], best)
+        self.assertIn('<mark>кошка</mark>', page[0].snippet)
+        self.assertIn('&lt;b&gt;', page[0].snippet)
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(author=self.user, text='Старый текст')
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(len(self.search(q='старый')), 0)
+        self.assertEqual(list(self.search(q='новый')), [post])
+
+        post.delete()
+        self.assertEqual(len(self.search(q='новый')), 0)
+
+    @override_settings(NUMBER_OF_POSTS=2)
+    def test_cursor_pages_cover_all_results(self):
+        posts = Post.objects.bulk_create(
+            Post(author=self.user, text='слово ' * (i % 3 + 1))
+            for i in range(5)
+        )
+        for order in ('rank', 'new'):
+            with self.subTest(order=order):
+                seen = []
+                page = self.search(q='слово', order=order)
+                seen += page
+                while page.has_next():
+                    page = self.search(
+                        q='слово', order=order, cursor=page.next_cursor)
+                    seen += page
+                self.assertEqual(len(seen), len(posts))
+                self.assertEqual(len(set(seen)), len(posts))
+
+                previous = self.search(
+                    q='слово', order=order, cursor=page.previous_cursor)
+                self.assertEqual(list(previous), seen[-3:-1])
+
+    @override_settings(NUMBER_OF_POSTS=1)
+    def test_new_order_by_pub_date(self):
+        """«Новые» - по дате поста, а не по id: у импортированных
+        постов даты прошлые."""
+        recent = Post.objects.create(author=self.user, text='Слово сейчас')
+        old = Post.objects.create(author=self.user, text='Слово давно')
+        Post.objects.filter(pk=old.pk).update(
+            pub_date=datetime(2019, 5, 1, tzinfo=timezone.utc))
+
+        page = self.search(q='слово', order='new')
+        self.assertEqual(list(page), [recent])
+        page = self.search(q='слово', order='new', cursor=page.next_cursor)
+        self.assertEqual(list(page), [old])
+        self.assertFalse(page.has_next())
+
+    def test_admin_search_uses_index(self):
+        found = Post.objects.create(author=self.user, text='Редкое слово')
+        Post.objects.create(author=self.user, text='Обычный текст')
+        queryset, distinct = PostAdmin(Post, site).get_search_results(
+            None, Post.objects.all(), 'редк')
+        self.assertEqual(list(queryset), [found])
+        self.assertFalse(distinct)
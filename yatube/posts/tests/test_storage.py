@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts.models import MediaBlob, Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='blob_author')
+
+    def create_post(self, name='cat.gif', content=SMALL_GIF):
+        return Post.objects.create(
+            text='Пост',
+            author=self.user,
+            image=SimpleUploadedFile(name, content, 'image/gif'),
+        )
+
+    def test_identical_uploads_stored_once(self):
+        first = self.create_post('cat.gif')
+        second = self.create_post('same_cat.GIF')
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            MediaBlob.objects.get(name=first.image.name).refcount, 2)
+
+        second.delete()
+        self.assertEqual(
+            MediaBlob.objects.get(name=first.image.name).refcount, 1)
+
+    def test_gc_removes_only_unreferenced_blobs(self):
+        kept = self.create_post('kept.gif')
+        dropped = self.create_post('dropped.gif', SMALL_GIF + b'\x00')
+        path = dropped.image.path
+        dropped.delete()
+
+        call_command('gc_blobs', grace=0, stdout=StringIO())
+
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.filter(refcount=0).exists())
+        self.assertTrue(os.path.exists(kept.image.path))
+
+    def test_gc_media_removes_orphans(self):
+        kept = self.create_post('kept.gif')
+        orphans = [
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'old.gif'),
+            os.path.join(TEMP_MEDIA_ROOT, 'cache', 'ab', 'cd', 'old.jpg'),
+        ]
+        for path in orphans:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(SMALL_GIF)
+
+        call_command('gc_media', dry_run=True, grace=0, stdout=StringIO())
+        self.assertTrue(all(map(os.path.exists, orphans)))
+
+        call_command('gc_media', grace=0, stdout=StringIO())
+        self.assertFalse(any(map(os.path.exists, orphans)))
+        self.assertTrue(os.path.exists(kept.image.path))
@@ -0,0 +1,80 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post, PostTag
+from posts.tags import extract_tags, link_tags
+
+User = get_user_model()
+
+
+class TagTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tagger')
+
+    def setUp(self):
+        cache.clear()
+
+    def tags_of(self, post):
+        return set(
+            PostTag.objects.filter(post=post).values_list('tag', flat=True))
+
+    def test_extract_tags(self):
+        self.assertEqual(
+            extract_tags('#Кот и #кот, #dog_2 a#b &#123; #42 ##x'),
+            {'кот', 'dog_2'})
+
+    def test_link_tags_escapes_text(self):
+        html = link_tags('<b>#Кот</b>')
+        self.assertIn('&lt;b&gt;', html)
+        self.assertIn(
+            f'<a href="{reverse("posts:tag_posts", args=["кот"])}">#Кот</a>',
+            html)
+
+    def test_tags_follow_post_edits(self):
+        post = Post.objects.create(author=self.user, text='#один #два')
+        self.assertEqual(self.tags_of(post), {'один', 'два'})
+
+        post.text = '#два #три'
+        post.save()
+        self.assertEqual(self.tags_of(post), {'два', 'три'})
+
+        post.delete()
+        self.assertFalse(PostTag.objects.exists())
+
+    @override_settings(NUMBER_OF_POSTS=2)
+    def test_tag_feed_pages(self):
+        tagged = [
+            Post.objects.create(author=self.user, text=f'#лента {i}')
+            for i in range(3)
+        ]
+        Post.objects.create(author=self.user, text='без тега')
+        url = reverse('posts:tag_posts', args=['лента'])
+
+        page = self.client.get(url).context['page_obj']
+        self.assertEqual(list(page), tagged[:0:-1])
+        page = self.client.get(
+            url, {'cursor': page.next_cursor}).context['page_obj']
+        self.assertEqual(list(page), tagged[:1])
+        self.assertFalse(page.has_next())
+
+        response = self.client.get(
+            reverse('posts:tag_posts', args=['Лента']))
+        self.assertRedirects(response, url)
+
+    def test_reindex_fixes_bulk_created_posts(self):
+        post = Post.objects.create(author=self.user, text='#старый')
+        Post.objects.filter(pk=post.pk).update(text='#новый #еще')
+        Post.objects.bulk_create([Post(author=self.user, text='#массовый')])
+
+        call_command('reindex_tags', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(self.tags_of(post), {'новый', 'еще'})
+        self.assertEqual(
+            PostTag.objects.filter(tag='массовый').count(), 1)
@@ -1,14 +1,40 @@
+import shutil
+import tempfile
+import warnings
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django import forms
 from posts.models import Post, Group, Comment, Follow
 from posts.forms import PostForm
+from posts.caching import bump
+from posts.templatetags.post_cards import card_key, post_cards
+from posts.thumbnails import generate_thumbnails
+from posts.utils import FORWARD, KeysetPaginator, encode_cursor
 from django.conf import settings
 from django.core.cache import caches
+from sorl.thumbnail import default
 
 
 User = get_user_model()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 class TaskPagesTests(TestCase):
@@ -43,6 +69,8 @@ class TaskPagesTests(TestCase):
         self.authorized_client.force_login(self.user)
         cache = caches['default']
         cache.clear()
+        # LRU записей sorl живет в процессе дольше тестовой транзакции
+        default.kvstore.local.clear()
 
     def checking_context(self, post_1, post_2):
         self.assertEqual(post_1.group, post_2.group)
@@ -171,6 +199,46 @@ class TaskPagesTests(TestCase):
                          - settings.NUMBER_OF_POSTS
                          )
 
+    def test_keyset_paginator(self):
+        """Курсоры ведут вперед и назад без пропусков и повторов."""
+
+        posts_count = 13
+        Post.objects.bulk_create(
+            Post(text='Курсор ' + str(i), author=self.user)
+            for i in range(posts_count)
+        )
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True)
+        )
+
+        response = self.client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        self.assertIsInstance(first_page.paginator, KeysetPaginator)
+        self.assertFalse(first_page.has_previous())
+        self.assertEqual([post.pk for post in first_page],
+                         expected[:settings.NUMBER_OF_POSTS])
+
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': first_page.next_cursor})
+        second_page = response.context['page_obj']
+        self.assertFalse(second_page.has_next())
+        self.assertEqual([post.pk for post in second_page],
+                         expected[settings.NUMBER_OF_POSTS:])
+
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': second_page.previous_cursor})
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         expected[:settings.NUMBER_OF_POSTS])
+
+        # испорченный курсор отдает первую страницу
+        overflow = encode_cursor(FORWARD, timezone.now(), 2 ** 64)
+        for cursor in ('%%%', overflow):
+            response = self.client.get(
+                reverse('posts:index'), {'cursor': cursor})
+            self.assertEqual(len(response.context['page_obj']),
+                             settings.NUMBER_OF_POSTS)
+
     def test_new_post_on_index_page(self):
         """Новый пост должен появляться на главной странице."""
 
@@ -246,14 +314,81 @@ class TaskPagesTests(TestCase):
         first_object = response.context['post'].comments.first()
         self.assertEqual(first_object.text, 'Тестовый коммент')
 
+    def test_post_detail_queries_do_not_grow_with_comments(self):
+        """Число запросов страницы поста не зависит от числа комментариев,
+        комментарии отдаются страницами."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        Comment.objects.create(author=self.user, post=self.post, text='0')
+        self.authorized_client.get(url)
+        with CaptureQueriesContext(connection) as one_comment:
+            self.authorized_client.get(url)
+
+        for i in range(settings.NUMBER_OF_COMMENTS + 5):
+            commenter = User.objects.create_user(username=f'commenter_{i}')
+            Comment.objects.create(author=commenter, post=self.post, text=i)
+        with self.assertNumQueries(len(one_comment)):
+            response = self.authorized_client.get(url)
+
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.NUMBER_OF_COMMENTS)
+        self.assertEqual(comments[0].text, '0')
+        self.assertTrue(comments.has_next())
+
+        # старые ссылки ?page=N листают в том же порядке
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            response = self.authorized_client.get(url, {'page': 2})
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [str(i) for i in range(settings.NUMBER_OF_COMMENTS - 1,
+                                   settings.NUMBER_OF_COMMENTS + 5)])
+
+    def test_post_cards_cached_per_post(self):
+        """Правка поста перерисовывает только его карточку."""
+        other = Post.objects.create(author=self.user, text='Другой пост')
+        posts = [self.post, other]
+        post_cards(posts)
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Правленый текст'
+        post.save()
+        posts = [post, other]
+        with mock.patch(
+            'posts.templatetags.post_cards.render_to_string',
+            wraps=render_to_string,
+        ) as render:
+            cards = post_cards(posts)
+        render.assert_called_once()
+        self.assertIn('Правленый текст', cards[0])
+        self.assertIn('Другой пост', cards[1])
+
+    def test_cards_follow_author_and_group_edits(self):
+        """Новое имя автора и slug группы видны в закэшированных
+        лентах сразу, а вход пользователя карточки не сбрасывает."""
+        url = reverse('posts:index')
+        self.authorized_client.get(url)
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Переименованный'
+        author.save()
+        self.assertContains(self.authorized_client.get(url),
+                            'Переименованный')
+
+        group = Group.objects.get(pk=self.test_group.pk)
+        group.slug = 'renamed-group'
+        group.save()
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=[author.username]))
+        self.assertContains(response, '/group/renamed-group/')
+
+        key = card_key(self.post)
+        self.client.force_login(author)
+        self.assertEqual(card_key(self.post), key)
+
     def test_cache_index_page(self):
         """Проверка кеширования главной страницы"""
         response_before = self.authorized_client.get(reverse('posts:index'))
-        self.post_second = Post.objects.create(
-            text='Тестовый 2',
-            author=self.user,
-        )
-        # без чистки кеша контент остался тот-же
+        # правка в обход сигналов не сбрасывает кеш - контент остался тот-же
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
         response_after = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response_before.content, response_after.content)
 
@@ -268,6 +403,36 @@ class TaskPagesTests(TestCase):
             response_after_clear.content
         )
 
+    def test_cache_invalidated_by_new_post(self):
+        """Новый пост сразу сбрасывает закешированные страницы лент."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'slug'}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+
+        Post.objects.create(
+            text='Свежий пост', author=self.user, group=self.test_group)
+
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Свежий пост')
+
+    def test_cache_varies_on_page(self):
+        """Вторая страница не отдает закешированную первую."""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.user)
+            for i in range(settings.NUMBER_OF_POSTS)
+        )
+        first = self.client.get(reverse('posts:index'))
+        second = self.client.get(
+            reverse('posts:index'),
+            {'cursor': first.context['page_obj'].next_cursor})
+        self.assertNotEqual(first.content, second.content)
+
     def test_new_post_on_follow_page(self):
         """Новый пост должен появляться на главной у тех, кто подписан.
         И не появляться у тех, кто не подписан"""
@@ -313,3 +478,57 @@ class TaskPagesTests(TestCase):
             )
         )
         self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_feed_queries_use_index_order(self):
+        """Запросы лент читают индекс в нужном порядке, без сортировки."""
+        out = StringIO()
+        call_command('explain_views', stdout=out)
+        report = out.getvalue()
+        self.assertIn('USING INDEX post_pub_date_idx', report)
+        self.assertNotIn('USE TEMP B-TREE FOR', report)
+
+    def test_feed_thumbnails_read_in_one_query(self):
+        """Записи о миниатюрах ленты читаются одним запросом,
+        а прогретые - из кэша, совсем без запросов."""
+        media = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        cache = caches['default']
+
+        def kvstore_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.authorized_client.get(reverse('posts:index'))
+            return [
+                query for query in queries.captured_queries
+                if 'thumbnail_kvstore' in query['sql']
+            ]
+
+        with override_settings(MEDIA_ROOT=media):
+            posts = [
+                Post.objects.create(
+                    author=self.user,
+                    text=f'Картинка {i}',
+                    image=SimpleUploadedFile(
+                        f'feed_{i}.gif', SMALL_GIF, 'image/gif'),
+                )
+                for i in range(3)
+            ]
+            for post in posts:
+                generate_thumbnails(post.image.name)
+
+            # холодные LRU и общий кэш: один запрос на всю страницу
+            default.kvstore.local.clear()
+            cache.clear()
+            self.assertEqual(len(kvstore_queries()), 1)
+
+            # LRU пуст, записи в общем кэше
+            default.kvstore.local.clear()
+            # варианты картинок сдвинули updated_at, ключи карточек новые
+            cache.delete_many([
+                card_key(post) for post in Post.objects.exclude(image='')
+            ])
+            bump('index')
+            self.assertEqual(kvstore_queries(), [])
+
+            # общий кэш пуст, записи в LRU
+            cache.clear()
+            self.assertEqual(kvstore_queries(), [])
@@ -0,0 +1,213 @@
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from core.metrics import THUMBNAIL_SECONDS
+from sorl.thumbnail import base, default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .caching import bump_post_feeds
+from .models import Post
+from .variants import build_variants, image_info, variants_dir
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# имена картинок, для которых генерация уже стоит в очереди
+_pending = set()
+
+
+class ThumbnailBackend(base.ThumbnailBackend):
+    """Бэкенд sorl, который умеет только проверить, готова ли миниатюра,
+    ничего не открывая и не генерируя."""
+
+    def thumbnail_name(self, file_, geometry_string, options):
+        # те же умолчания, что добавляет base.ThumbnailBackend.get_thumbnail,
+        # иначе имя миниатюры не совпадет
+        source = ImageFile(file_)
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return self._get_thumbnail_filename(source, geometry_string, options)
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра из key-value хранилища sorl или None."""
+        name = self.thumbnail_name(file_, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = ThumbnailBackend()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def failure_key(name):
+    return f'thumbnail-failed:{name}'
+
+
+def thumbnails_failed(name):
+    """Не удалось ли построить миниатюры name за последние
+    THUMBNAIL_FAILURE_TIMEOUT секунд: такие не ставим в очередь снова."""
+    return cache.get(failure_key(name)) is not None
+
+
+def remember_failure(name):
+    cache.set(failure_key(name), True, settings.THUMBNAIL_FAILURE_TIMEOUT)
+
+
+def thumbnails_built(name):
+    # на битой картинке sorl не бросает исключение, а пишет в лог
+    # и возвращает миниатюру без записи в хранилище
+    return all(
+        backend.get_ready_thumbnail(name, geometry, **options)
+        for geometry, options in settings.POST_THUMBNAILS.values()
+    )
+
+
+def image_fields(name):
+    """Варианты для srcset и сведения о картинке для полей Post;
+    то, что посчитать не удалось, пропускается."""
+    fields = {}
+    try:
+        with THUMBNAIL_SECONDS.labels('variants').time():
+            fields['image_variants'] = build_variants(name)
+    except Exception:
+        logger.exception('Не удалось построить варианты для %s', name)
+    try:
+        with THUMBNAIL_SECONDS.labels('info').time():
+            fields.update(image_info(name))
+    except Exception:
+        logger.exception('Не удалось разобрать картинку %s', name)
+    return fields
+
+
+def generate_thumbnails(name, close_connection=False):
+    """Строит миниатюры всех размеров из POST_THUMBNAILS, варианты
+    картинки для srcset и считает ее размеры, цвет и превью."""
+    try:
+        with THUMBNAIL_SECONDS.labels('thumbnails').time():
+            for geometry, options in settings.POST_THUMBNAILS.values():
+                get_thumbnail(name, geometry, **options)
+        if not thumbnails_built(name):
+            logger.warning('Не удалось построить миниатюры для %s', name)
+            remember_failure(name)
+            return
+        fields = image_fields(name)
+        if fields:
+            # новый updated_at дает карточкам поста новый ключ
+            Post.objects.filter(image=name).update(
+                updated_at=timezone.now(), **fields)
+        # страницы лент с заглушкой вместо картинки больше не нужны
+        posts = Post.objects.filter(image=name).only(
+            'author', 'group', 'text')
+        for post in posts:
+            bump_post_feeds(post)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры для %s', name)
+        remember_failure(name)
+    finally:
+        _pending.discard(name)
+        if close_connection:
+            # у каждого потока пула свое соединение с базой (kvstore sorl)
+            connection.close()
+
+
+def use_pool():
+    # потоки с SQLite в памяти (тестовая база) делят одну базу
+    # через shared cache и получают "database table is locked"
+    in_memory = getattr(connection, 'is_in_memory_db', lambda: False)
+    return settings.THUMBNAIL_WORKERS and not in_memory()
+
+
+def submit_thumbnails(name, inline=True):
+    if not name or name in _pending or thumbnails_failed(name):
+        return
+    if not use_pool():
+        if inline:
+            generate_thumbnails(name)
+        return
+    _pending.add(name)
+    get_executor().submit(generate_thumbnails, name, True)
+
+
+def queue_thumbnails(name, inline=True):
+    """Ставит генерацию миниатюр в пул потоков после фиксации транзакции,
+    чтобы поток не читал еще не сохраненную запись. Без пула
+    (THUMBNAIL_WORKERS = 0) строит их сразу, в текущем потоке,
+    а при inline=False пропускает."""
+    transaction.on_commit(lambda: submit_thumbnails(name, inline))
+
+
+def queue_post_thumbnails(post):
+    if post.image:
+        queue_thumbnails(post.image.name)
+
+
+def get_ready_thumbnail(image, preset):
+    """Готовая миниатюра размера preset из POST_THUMBNAILS или None."""
+    geometry, options = settings.POST_THUMBNAILS[preset]
+    # миниатюры строятся по имени файла в хранилище sorl по умолчанию,
+    # ключ источника должен совпасть
+    return backend.get_ready_thumbnail(image.name, geometry, **options)
+
+
+def prefetch_thumbnails(images):
+    """Загружает записи о миниатюрах всех картинок страницы одним
+    get_many, дальше шаблоны читают их из LRU хранилища."""
+    files = [
+        ImageFile(backend.thumbnail_name(image.name, geometry, options),
+                  default.storage)
+        for image in images if image
+        for geometry, options in settings.POST_THUMBNAILS.values()
+    ]
+    if files and hasattr(default.kvstore, 'get_many'):
+        default.kvstore.get_many(files)
+
+
+def thumbnail_names(name):
+    """Имена файлов миниатюр картинки name для всех POST_THUMBNAILS."""
+    return [
+        backend.thumbnail_name(name, geometry, options)
+        for geometry, options in settings.POST_THUMBNAILS.values()
+    ]
+
+
+def thumbnails_ready(image):
+    return all(
+        get_ready_thumbnail(image, preset)
+        for preset in settings.POST_THUMBNAILS
+    )
+
+
+def delete_image_files(name):
+    """Удаляет миниатюры sorl с их записями и варианты картинки name.
+    Сам файл картинки не трогает."""
+    default.kvstore.delete(ImageFile(name))
+    shutil.rmtree(
+        os.path.join(settings.MEDIA_ROOT, variants_dir(name)),
+        ignore_errors=True,
+    )
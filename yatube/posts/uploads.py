@@ -0,0 +1,96 @@
+from io import BytesIO
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+INVALID_IMAGE = forms.ImageField.default_error_messages['invalid_image']
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Принимает картинку потоком во временный файл, не держа ее в памяти.
+
+    Формат и размеры узнаем по заголовку из первых байт, не декодируя
+    пиксели. Слишком большой файл, чужой формат или слишком много
+    пикселей (бомба распаковки) отбрасываются сразу: остаток тела
+    запроса дочитывается, но на диск уже не пишется. Причину отказа
+    показывает форма (PostForm) по атрибуту upload_error файла.
+
+    На сайте загружаются только картинки, поэтому обработчик включен
+    для всех загрузок (FILE_UPLOAD_HANDLERS).
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        # байты от начала файла, пока заголовок не разобран
+        self.header = bytearray()
+        self.image_format = None
+        self.image_size = None
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_IMAGE_MAX_BYTES:
+            self.reject(
+                'Файл больше '
+                f'{filesizeformat(settings.UPLOAD_IMAGE_MAX_BYTES)}.')
+            return None
+        if self.image_format is None:
+            self.header += raw_data
+            self.read_header(complete=False)
+            if self.error:
+                return None
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.image_format is None and not self.error:
+            self.read_header(complete=True)
+        file = super().file_complete(file_size)
+        file.upload_error = self.error
+        file.image_format = self.image_format
+        file.image_size = self.image_size
+        return file
+
+    def read_header(self, complete):
+        """Разбирает заголовок; пока его не хватает, ждем следующих байт."""
+        try:
+            # Image.open читает только заголовок, пиксели не трогает
+            with Image.open(BytesIO(self.header)) as image:
+                image_format, image_size = image.format, image.size
+        except Image.DecompressionBombError:
+            self.reject_pixels()
+            return
+        except Exception:
+            if complete or len(self.header) >= (
+                    settings.UPLOAD_IMAGE_HEADER_BYTES):
+                self.reject(INVALID_IMAGE)
+            return
+
+        self.header = None
+        width, height = image_size
+        if image_format not in settings.UPLOAD_IMAGE_FORMATS:
+            self.reject(INVALID_IMAGE)
+        elif width * height > settings.UPLOAD_IMAGE_MAX_PIXELS:
+            self.reject_pixels()
+        else:
+            self.image_format = image_format
+            self.image_size = image_size
+
+    def reject_pixels(self):
+        self.reject(
+            'Слишком большая картинка: больше '
+            f'{settings.UPLOAD_IMAGE_MAX_PIXELS:,} пикселей.'
+            .replace(',', ' '))
+
+    def reject(self, message):
+        self.error = message
+        self.header = None
+        # уже записанное больше не нужно
+        self.file.seek(0)
+        self.file.truncate()
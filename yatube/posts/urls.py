@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
@@ -10,6 +10,10 @@ urlpatterns = [
     path('group/', views.group_list),
     # отдельная группа
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    # лента хэштега
+    path('tag/<str:name>/', views.tag_posts, name='tag_posts'),
+    # поиск по постам
+    path('search/', views.search, name='search'),
     # Профайл пользователя
     path('profile/<str:username>/', views.profile, name='profile'),
     # Просмотр записи
@@ -36,4 +40,11 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    # JSON-версии лент и поста
+    path('api/posts/', api.index, name='api_index'),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group_posts'),
+    path('api/profile/<str:username>/', api.profile, name='api_profile'),
+    path(
+        'api/posts/<int:post_id>/', api.post_detail, name='api_post_detail'
+    ),
 ]
@@ -1,8 +1,157 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
+
+from django.core.paginator import Page, Paginator
 from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+FORWARD = 'n'
+BACKWARD = 'p'
+CURSOR_SEPARATOR = '|'
+# id в курсоре - целое SQLite; больше не привязать к запросу
+MAX_CURSOR_PK = 2 ** 63 - 1
+
+
+def encode_value(value):
+    # json не знает дат; isoformat без потери микросекунд
+    return value.isoformat()
+
+
+# компактный JSON без экранирования кириллицы: ответы API и выгрузка
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'),
+                                default=encode_value)
+
+
+def encode_cursor(direction, key, pk):
+    """Упаковывает позицию (ключ, id) в непрозрачный токен для ?cursor=.
+    Ключ - дата или число, например ранг в поиске."""
+    key = key.isoformat() if hasattr(key, 'isoformat') else repr(key)
+    raw = CURSOR_SEPARATOR.join((direction, key, str(pk)))
+    token = base64.urlsafe_b64encode(raw.encode())
+    return token.decode().rstrip('=')
+
+
+def decode_cursor(token, parse=parse_datetime):
+    """Возвращает (направление, (ключ, id)), ключ разбирает parse.
+    Для пустого или испорченного токена - первая страница."""
+    if not token:
+        return FORWARD, None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        direction, key, pk = raw.split(CURSOR_SEPARATOR)
+        key = parse(key)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return FORWARD, None
+    if (direction not in (FORWARD, BACKWARD) or key is None
+            or not 0 <= pk <= MAX_CURSOR_PK):
+        return FORWARD, None
+    return direction, (key, pk)
+
+
+def seek(queryset, direction, position, limit,
+         date_field='pub_date', pk_field='pk', ascending=False):
+    """Срез queryset в порядке (дата, id) сразу после позиции курсора.
+    По умолчанию лента идет от новых к старым, ascending - наоборот."""
+    if (direction == BACKWARD) != ascending:
+        lookup = 'gt'
+        ordering = (date_field, pk_field)
+    else:
+        lookup = 'lt'
+        ordering = ('-' + date_field, '-' + pk_field)
+
+    queryset = queryset.order_by(*ordering)
+    if position is not None:
+        date, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{lookup}': date})
+            | Q(**{date_field: date, f'{pk_field}__{lookup}': pk})
+        )
+    return queryset[:limit]
 
 
-def get_paginators_page(posts, request):
-    paginator = Paginator(posts, settings.NUMBER_OF_POSTS)
+class KeysetPaginator(Paginator):
+    """Пагинатор по ключу (дата, id).
+    Каждая страница - это один индексный проход с LIMIT, без OFFSET,
+    поэтому страница 50000 стоит столько же, сколько первая."""
+
+    keyset = True
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 ascending=False):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+        self.ascending = ascending
+        self._num_pages = 1
+
+    def _check_object_list_is_ordered(self):
+        # порядок (дата, id) задает seek(), исходный не важен
+        pass
+
+    @property
+    def num_pages(self):
+        """Общего числа страниц мы не знаем и не считаем: страниц ровно
+        столько, чтобы Page.has_next() и has_previous() видели соседей."""
+        return self._num_pages
+
+    def get_cursor_page(self, cursor):
+        direction, position = decode_cursor(cursor)
+        rows = self.fetch(direction, position)
+        return self.build_page(rows, direction, position)
+
+    def fetch(self, direction, position):
+        """Читает per_page + 1 строк после (или до) позиции курсора.
+        Лишняя строка говорит о том, что дальше есть еще страница."""
+        return list(seek(
+            self.object_list, direction, position, self.per_page + 1,
+            date_field=self.date_field, ascending=self.ascending))
+
+    def build_page(self, rows, direction, position):
+        """Собирает страницу из уже прочитанных строк в порядке чтения."""
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == BACKWARD:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        has_next = has_next and bool(rows)
+        has_previous = has_previous and bool(rows)
+        number = 2 if has_previous else 1
+        self._num_pages = number + 1 if has_next else number
+
+        page = Page(rows, number, self)
+        page.next_cursor = page.previous_cursor = None
+        if has_next:
+            page.next_cursor = self.cursor_for(FORWARD, rows[-1])
+        if has_previous:
+            page.previous_cursor = self.cursor_for(BACKWARD, rows[0])
+        return page
+
+    def cursor_for(self, direction, row):
+        return encode_cursor(
+            direction, getattr(row, self.date_field), row.pk)
+
+
+def get_paginators_page(posts, request, date_field='pub_date',
+                        per_page=None, ascending=False):
+    """Возвращает страницу постов.
+    По умолчанию листаем курсорами (?cursor=), старые ссылки вида ?page=N
+    продолжают работать через обычный Paginator."""
+    per_page = per_page or settings.NUMBER_OF_POSTS
+    cursor = request.GET.get('cursor')
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if page_number and not cursor:
+        # тот же порядок, что у курсоров: queryset может быть без него
+        sign = '' if ascending else '-'
+        posts = posts.order_by(sign + date_field, sign + 'pk')
+        paginator = Paginator(posts, per_page)
+        return paginator.get_page(page_number)
+
+    paginator = KeysetPaginator(
+        posts, per_page, date_field=date_field, ascending=ascending)
+    return paginator.get_cursor_page(cursor)
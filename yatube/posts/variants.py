@@ -0,0 +1,170 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+try:
+    # AVIF в Pillow появляется только с этим плагином
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+CONTENT_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg'}
+# тег EXIF с ориентацией снимка
+ORIENTATION = 0x0112
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def supported_formats():
+    """Форматы из POST_IMAGE_FORMATS, которые умеет сохранять Pillow."""
+    Image.init()
+    return [
+        fmt for fmt in settings.POST_IMAGE_FORMATS if fmt in Image.SAVE
+    ]
+
+
+def render_variants(source, target_dir, widths, formats, ratio, quality):
+    """Режет картинку под пропорции карточки и сохраняет ее во всех
+    ширинах и форматах. Работает в отдельном процессе, поэтому знает
+    только пути к файлам, без Django.
+    Возвращает [(формат, ширина, имя файла, байт), ...]."""
+    os.makedirs(target_dir, exist_ok=True)
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        # больше исходника не растягиваем, но хотя бы одна ширина будет
+        fit = [width for width in widths if width <= image.width]
+        fit = fit or [min(widths)]
+
+        result = []
+        for width in sorted(fit):
+            height = max(1, round(width * ratio[1] / ratio[0]))
+            resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            for fmt in formats:
+                frame = resized
+                if fmt == 'JPEG' and frame.mode != 'RGB':
+                    frame = frame.convert('RGB')
+                filename = f'{width}w.{EXTENSIONS[fmt]}'
+                path = os.path.join(target_dir, filename)
+                frame.save(path, fmt, quality=quality[fmt])
+                result.append((fmt, width, filename, os.path.getsize(path)))
+        return result
+
+
+def describe_image(source, ratio, lqip_width):
+    """Размеры картинки, ее основной цвет и крошечное превью (LQIP)
+    в пропорциях карточки, как data: URI. Пиксели декодируются
+    в уменьшенном виде (draft для JPEG), так что это дешево даже
+    для больших файлов. Работает в пуле процессов, как render_variants."""
+    with Image.open(source) as image:
+        width, height = image.size
+        # повернутые по EXIF снимки показываются с другой стороны
+        if image.getexif().get(ORIENTATION) in (5, 6, 7, 8):
+            width, height = height, width
+        image.draft('RGB', (lqip_width * 8, lqip_width * 8))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    small = image.copy()
+    small.thumbnail((64, 64))
+    paletted = small.quantize(colors=4)
+    _, index = max(paletted.getcolors())
+    red, green, blue = paletted.getpalette()[index * 3:index * 3 + 3]
+
+    lqip_height = max(1, round(lqip_width * ratio[1] / ratio[0]))
+    lqip = ImageOps.fit(image, (lqip_width, lqip_height), Image.BOX)
+    buffer = BytesIO()
+    lqip.save(buffer, 'PNG', optimize=True)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_color': f'#{red:02x}{green:02x}{blue:02x}',
+        'image_lqip': 'data:image/png;base64,'
+                      + base64.b64encode(buffer.getvalue()).decode(),
+    }
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_PROCESSES)
+    return _executor
+
+
+def run_in_pool(func, *args):
+    """Выполняет func в пуле процессов Pillow, если он включен."""
+    if settings.IMAGE_VARIANT_PROCESSES:
+        return get_executor().submit(func, *args).result()
+    return func(*args)
+
+
+def variants_dir(name):
+    """Каталог вариантов картинки относительно MEDIA_ROOT."""
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f'variants/{digest[:2]}/{digest}'
+
+
+def build_variants(name):
+    """Строит варианты картинки name (в пуле процессов, если он включен)
+    и возвращает их описание для Post.image_variants."""
+    directory = variants_dir(name)
+    args = (
+        os.path.join(settings.MEDIA_ROOT, name),
+        os.path.join(settings.MEDIA_ROOT, directory),
+        settings.POST_IMAGE_WIDTHS,
+        supported_formats(),
+        settings.POST_IMAGE_RATIO,
+        settings.POST_IMAGE_QUALITY,
+    )
+    rendered = run_in_pool(render_variants, *args)
+
+    sources = {}
+    for fmt, width, filename, size in rendered:
+        sources.setdefault(fmt, []).append(
+            [width, f'{directory}/{filename}', size])
+    return json.dumps({'source': name, 'sources': sources})
+
+
+def image_info(name):
+    """Поля Post с размерами, цветом и LQIP картинки name."""
+    return run_in_pool(
+        describe_image,
+        os.path.join(settings.MEDIA_ROOT, name),
+        settings.POST_IMAGE_RATIO,
+        settings.POST_IMAGE_LQIP_WIDTH,
+    )
+
+
+def image_sources(post):
+    """<source> для <picture> поста: [(content type, srcset), ...],
+    от лучшего формата к JPEG. Пусто, пока варианты не построены
+    или если они остались от прежней картинки."""
+    if not post.image or not post.image_variants:
+        return []
+    variants = json.loads(post.image_variants)
+    if variants['source'] != post.image.name:
+        return []
+    result = []
+    for fmt in settings.POST_IMAGE_FORMATS:
+        if fmt in variants['sources']:
+            srcset = ', '.join(
+                f'{settings.MEDIA_URL}{name} {width}w'
+                for width, name, _ in variants['sources'][fmt]
+            )
+            result.append((CONTENT_TYPES[fmt], srcset))
+    return result
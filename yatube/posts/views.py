@@ -1,8 +1,14 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from .models import Post, Group, User, Follow
-from .forms import PostForm, CommentForm
+from .forms import PostForm, CommentForm, SearchForm
 from .utils import get_paginators_page
+from .feeds import get_follow_page, get_profile_page, get_tag_page
+from .caching import feed_cache
+from .counters import get_user_stats
+from .thumbnails import queue_post_thumbnails
+from .search import get_search_page
 
 
 def index(request):
@@ -15,6 +21,7 @@ def index(request):
         'posts/index.html',
         {
             'page_obj': page_obj,
+            'feed_cache': feed_cache(request, ('index',)),
             'index': True,
             'follow': False
         }
@@ -31,7 +38,47 @@ def group_posts(request, slug):
     return render(
         request,
         'posts/group_list.html',
-        {'group': group, 'page_obj': page_obj})
+        {'group': group,
+         'page_obj': page_obj,
+         'feed_cache': feed_cache(request, ('group', group.pk))})
+
+
+def tag_posts(request, name):
+    """ Последние статьи с хэштегом."""
+
+    tag = name.lower()
+    if tag != name:
+        return redirect('posts:tag_posts', tag)
+    page_obj = get_tag_page(request, tag)
+
+    return render(
+        request,
+        'posts/tag.html',
+        {'tag': tag,
+         'page_obj': page_obj,
+         'feed_cache': feed_cache(request, ('tag', tag))})
+
+
+def search(request):
+    """ Поиск по тексту постов: сначала самые подходящие или самые новые."""
+
+    form = SearchForm(request.GET)
+    page_obj = None
+    page_query = ''
+    if form.is_valid() and form.cleaned_data['q']:
+        page_obj = get_search_page(
+            request, form.cleaned_data['q'], form.cleaned_data['order'])
+        # курсоры страниц не должны терять сам запрос
+        page_query = request.GET.copy()
+        page_query.pop('cursor', None)
+        page_query = page_query.urlencode() + '&'
+
+    return render(
+        request,
+        'posts/search.html',
+        {'form': form,
+         'page_obj': page_obj,
+         'page_query': page_query})
 
 
 def group_list(request):
@@ -49,8 +96,7 @@ def profile(request, username):
     """ Показывает информацию об авторе и его статьи."""
 
     author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('group').all()
-    page_obj = get_paginators_page(posts, request)
+    page_obj = get_profile_page(request, author)
 
     following = (request.user.is_authenticated
                  and Follow.objects.filter(
@@ -60,19 +106,33 @@ def profile(request, username):
         request,
         'posts/profile.html',
         {'author': author,
+         'stats': get_user_stats(author),
          'page_obj': page_obj,
+         'feed_cache': feed_cache(request, ('author', author.pk)),
          'following': following})
 
 
 def post_detail(request, post_id):
     """ Показывает информацию о конкретной статье."""
 
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
+    # комментарии листаются страницами от старых к новым
+    comments = get_paginators_page(
+        post.comments.select_related('author'),
+        request,
+        date_field='created',
+        per_page=settings.NUMBER_OF_COMMENTS,
+        ascending=True,
+    )
 
     form = CommentForm()
     return render(request,
                   'posts/post_detail.html',
-                  {'post': post, 'form': form})
+                  {'post': post,
+                   'comments': comments,
+                   'author_stats': get_user_stats(post.author),
+                   'form': form})
 
 
 @login_required
@@ -94,6 +154,7 @@ def post_create(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    queue_post_thumbnails(post)
 
     return redirect('posts:profile', request.user.username)
 
@@ -112,6 +173,7 @@ def post_edit(request, post_id):
         if form.is_valid():
             post = form.save(commit=False)
             post.save()
+            queue_post_thumbnails(post)
             return redirect('posts:post_detail', post_id)
 
         # если не валидна, то открываем опять для редактирования
@@ -150,15 +212,15 @@ def add_comment(request, post_id):
 def follow_index(request):
     """Страница подписки. Показывает последние опубликованные статьи авторов,
     на которых подписан пользователь."""
-    posts = Post.objects.filter(author__following__user=request.user)
-
-    page_obj = get_paginators_page(posts, request)
+    page_obj = get_follow_page(request)
 
     return render(
         request,
         'posts/index.html',
         {
             'page_obj': page_obj,
+            'feed_cache': feed_cache(
+                request, ('index',), ('follow', request.user.pk)),
             'follow': True
         }
     )
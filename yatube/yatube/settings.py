@@ -1,4 +1,6 @@
 import os
+import tempfile
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -27,10 +29,13 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'benchmarks.apps.BenchmarksConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,7 +50,8 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендера (core/instrumentation.py)
+        'BACKEND': 'core.instrumentation.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -112,12 +118,149 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 NUMBER_OF_POSTS = 10
+NUMBER_OF_COMMENTS = 20
+# наибольший ?limit= страницы в JSON API (posts/api.py)
+API_MAX_PAGE_SIZE = 100
+
+# Ленты подписок (posts/feeds.py).
+# Посты авторов, у которых подписчиков не меньше порога, не раскладываются
+# по лентам при публикации, а подмешиваются при чтении.
+INBOX_FANOUT_LIMIT = 1000
+# Обратно автор начинает раскладываться, только когда подписчиков стало
+# меньше этого порога: отписки и подписки у самой границы не гоняют
+# ленты его читателей туда и обратно
+INBOX_FANOUT_RELEASE = 900
+# Сколько последних постов автора кладем в ленту при подписке
+INBOX_BACKFILL = 200
+# Сколько последних постов автора держим в кэше его ленты и сколько
+# секунд: в кэше без общего хранилища правки видны только своему процессу
+TIMELINE_SIZE = 500
+TIMELINE_CACHE_TIMEOUT = 300
+# Страницы лент кэшируются по поколениям (posts/caching.py), поэтому
+# устаревают сразу после правок, а не по таймауту
+FEED_CACHE_TIMEOUT = 60 * 60
+# Карточки постов кэшируются по id, updated_at и поколениям автора
+# и группы: правка поста, имени автора или slug группы дает новый ключ
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Поиск по тексту постов идет через индекс SQLite FTS5 (posts/search.py):
+# сколько слов запроса учитываем и сколько слов в отрывке с совпадением
+SEARCH_MAX_WORDS = 10
+SEARCH_SNIPPET_TOKENS = 24
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузки идут потоком во временный файл с проверкой заголовка
+# (posts/uploads.py): память на загрузку не зависит от размера файла
+FILE_UPLOAD_HANDLERS = ['posts.uploads.ImageUploadHandler']
+UPLOAD_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+UPLOAD_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+# Сколько байт от начала файла ждем, чтобы разобрать заголовок
+UPLOAD_IMAGE_HEADER_BYTES = 256 * 1024
+UPLOAD_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+# Картинки лежат по sha256 содержимого (posts/storage.py), одинаковые
+# хранятся один раз. gc_blobs удаляет файлы без ссылок, если они
+# не были нужны хотя бы столько секунд
+MEDIA_GC_GRACE = 60 * 60
+# Каталоги MEDIA_ROOT, где gc_media ищет файлы без ссылок: картинки
+# постов, миниатюры sorl и варианты для srcset
+MEDIA_GC_DIRS = ('posts', 'cache', 'variants')
+
+# Размеры миниатюр постов: строятся в фоне сразу после загрузки
+# (posts/thumbnails.py), шаблоны берут их по имени
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Потоков в пуле генерации миниатюр; 0 - строить сразу, в том же потоке
+THUMBNAIL_WORKERS = 2
+# Сколько секунд не ставим в очередь картинку, миниатюры которой
+# построить не удалось: битые файлы не гоняются по пулу на каждой странице
+THUMBNAIL_FAILURE_TIMEOUT = 60 * 60
+# Варианты картинок постов для srcset (posts/variants.py): ширины,
+# форматы от лучшего к запасному JPEG, качество и пропорции карточки.
+# Форматы, которые не умеет сохранять Pillow, пропускаются
+POST_IMAGE_WIDTHS = (320, 640, 960, 1280, 1920)
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+POST_IMAGE_QUALITY = {'AVIF': 50, 'WEBP': 75, 'JPEG': 80}
+POST_IMAGE_RATIO = (960, 339)
+POST_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+# Ширина превью (LQIP), которое встраивается в страницу до загрузки картинки
+POST_IMAGE_LQIP_WIDTH = 16
+# Процессов Pillow для вариантов; 0 - строить в том же процессе
+IMAGE_VARIANT_PROCESSES = 2
+# Записи sorl о миниатюрах: LRU процесса, общий кэш, затем таблица
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+# Сколько записей и сколько секунд держит LRU одного процесса
+THUMBNAIL_LOCAL_CACHE_SIZE = 5000
+THUMBNAIL_LOCAL_CACHE_TIMEOUT = 60 * 5
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Доля запросов, которые ServerTimingMiddleware замеряет: SQL, шаблоны,
+# кэш и общее время в заголовке Server-Timing и в логе core.timing.
+# По умолчанию выключено, чтобы лог не шел в консоль при разработке
+# и в тестах; на боевом сервере задается окружением, например 0.01
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.environ.get('SERVER_TIMING_SAMPLE_RATE', 0))
+
+# Метрики для /metrics: каждый процесс пишет в свой mmap-файл в этом
+# каталоге, /metrics складывает все файлы. Каталог должен быть локальным
+# для машины и общим для всех процессов сервера
+METRICS_DIR = os.environ.get(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'yatube-metrics'))
+# Корзины гистограмм времени ответа и обработки картинок, в секундах
+METRICS_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_THUMBNAIL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Запросы дольше стольких секунд пишутся в лог медленных запросов
+# с отпечатком SQL и вызвавшей их страницей, а при первой встрече
+# отпечатка - и с EXPLAIN. Сводку по логу дает команда slow_queries
+SLOW_QUERY_THRESHOLD = 0.1
+SLOW_QUERY_LOG = os.environ.get(
+    'SLOW_QUERY_LOG',
+    os.path.join(tempfile.gettempdir(), 'yatube-slow-queries.log'))
+# Для скольких последних отпечатков процесс помнит, что план уже записан
+SLOW_QUERY_EXPLAIN_CACHE = 1000
+
+# Бенчмарки страниц (manage.py benchmark): синтетический набор живет
+# в отдельной базе и переиспользуется между запусками, результаты
+# пишутся JSON-файлами по дате и коммиту
+BENCHMARK_DATABASE = os.environ.get(
+    'BENCHMARK_DATABASE',
+    os.path.join(tempfile.gettempdir(), 'yatube-benchmark.sqlite3'))
+BENCHMARK_RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'slow_queries': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        # по строке JSON на замеренный запрос
+        'core.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # по строке JSON на медленный запрос (core/slow_queries.py)
+        'core.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
@@ -3,7 +3,10 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import metrics
+
 urlpatterns = [
+    path('metrics', metrics, name='metrics'),
     path('auth/', include('users.urls')),
     path('', include('posts.urls', namespace='posts')),
     path('admin/', admin.site.urls),